@@ -1,23 +1,24 @@
 import streamlit as st
 from PIL import Image
-from modules.modules import run_assistant, convert_image_to_text, get_secret
+from modules.modules import run_assistant, convert_image_to_text, get_secret, AssistantRunError
 from modules.menu import menu, add_footer
 from utils.vocabvan import vocabvan_interface
 import json
-from auth.login_manager import login_user, login_organization, render_login_form, render_org_login_form
+import html
+from auth.login_manager import login_user, login_organization, render_login_form, render_org_login_form, start_user_session, restore_user_session
 from auth.register import register_user
 from auth.forgot_password import render_forgot_password_form
-from extra_pages.org_dashboard import show_org_dashboard
-from extra_pages.full_dashboard import full_org_dashboard
-from setup.firebase_setup import db
+from modules.feedback_cache import feedback_cache_key, lookup_feedback, store_feedback
+from jobs.evaluation_queue import enqueue_evaluation, get_job, STATUS_DONE, STATUS_FAILED, STATUS_RUNNING
 from streamlit_option_menu import option_menu
-from datetime import datetime
-import pytz
+from modules.telemetry import track_rerun, set_rerun_page
+import os
 
 
-# Initialize assistant
-secrets = get_secret()
-assistant = secrets['Unicke_id']
+# 'inline' evaluates on the script thread; 'queue' hands submissions to jobs/evaluation_worker.py
+EVALUATION_MODE = os.environ.get('EVALUATION_MODE', 'inline')
+# Seconds between job status checks while a queued evaluation is pending
+JOB_STATUS_INTERVAL = 2
 
 # Initialize session state
 if 'txt' not in st.session_state:
@@ -30,6 +31,10 @@ if 'organization' not in st.session_state:
     st.session_state.organization = None
 if 'feedback' not in st.session_state:
     st.session_state.feedback = None
+if 'evaluation_job' not in st.session_state:
+    st.session_state.evaluation_job = None
+if 'last_feedback_key' not in st.session_state:
+    st.session_state.last_feedback_key = None
 
 
 #Page Configuration
@@ -108,63 +113,112 @@ def get_input():
 
     return txt
 
-def display_feedback():
-    if 'feedback' in st.session_state and st.session_state.feedback:
+def render_feedback_box(feedback):
+    """Display feedback in a styled box with background color."""
+    st.markdown(f"""
+        <div style="border: 1px solid #ccc; padding: 10px; border-radius: 5px; background-color: #e8f4f8;">
+            {feedback}
+        </div>
+    """, unsafe_allow_html=True)
+
+def display_feedback(live_feedback=None):
+    """Show the finished feedback, or the partial feedback streamed so far when `live_feedback` is given."""
+    if live_feedback is not None:
+        st.subheader("AIからのフィードバック")
+        render_feedback_box(live_feedback)
+    elif 'feedback' in st.session_state and st.session_state.feedback:
         st.subheader("AIからのフィードバック")
         st.success("評価が完了しました！")
-
-        # Display feedback in a styled box with background color
-        st.markdown(f"""
-            <div style="border: 1px solid #ccc; padding: 10px; border-radius: 5px; background-color: #e8f4f8;">
-                {st.session_state.feedback}
-            </div>
-        """, unsafe_allow_html=True)
+        render_feedback_box(st.session_state.feedback)
 
 
 def save_submission(user_id, txt, uni_name, faculty_name, department_name):
     """Save submission to Firestore with necessary fields for the organization dashboard."""
+    from modules.submissions import write_submission
+
     try:
-        user_ref = db.collection('users').document(user_id)
-        user_data = user_ref.get().to_dict()
-
-        # Fetch 'org_code' and 'timezone' from the user's data
-        org_code = user_data.get('org_code', '')
-        user_timezone = user_data.get('timezone', 'UTC')
-
-        # Always save 'submit_time' in UTC
-        submit_time = datetime.now(pytz.utc)
-
-        user_ref.collection('submissions').add({
-            'text': txt,
-            'submit_time': submit_time,  # UTC time
-            'university': uni_name,
-            'faculty': faculty_name,
-            'department': department_name if department_name else "",
-            'org_code': org_code,
-            'timezone': user_timezone,  # You can still store the user's timezone for reference
-            'feedback': st.session_state.feedback
-        })
+        write_submission(user_id, txt, uni_name, faculty_name, department_name, st.session_state.feedback)
         return True
     except Exception as e:
         print(f"Error saving submission: {e}")
         return False
 
 
+def evaluate_inline(assistant, user_id, txt, information, uni_name, faculty_name, department_name, feedback_key):
+    """Run the evaluation on this script thread, streaming the feedback as it arrives."""
+    # Stream the feedback into a placeholder while it is generated
+    live_feedback = st.empty()
+
+    def show_partial_feedback(partial):
+        with live_feedback.container():
+            display_feedback(live_feedback=partial)
+
+    try:
+        st.session_state.feedback = run_assistant(
+            assistant_id=assistant, txt=information, return_content=True,
+            display_chat=False, on_text=show_partial_feedback
+        )
+    except AssistantRunError as e:
+        print(f"Error evaluating submission: {e}")
+        st.error("評価中にエラーが発生しました。もう一度お試しください。")
+    live_feedback.empty()
+
+    # Save submission using the dedicated function
+    if st.session_state.feedback:
+        store_feedback(feedback_key, st.session_state.feedback, assistant)
+        save_submission(user_id, txt, uni_name, faculty_name, department_name)
+
+
+@st.fragment(run_every=JOB_STATUS_INTERVAL)
+def display_evaluation_job():
+    """Poll the queued evaluation job and pick up its feedback once the worker is done."""
+    job = get_job(st.session_state.evaluation_job)
+    status = job.get('status') if job else STATUS_FAILED
+
+    if status == STATUS_DONE:
+        st.session_state.feedback = job['feedback']
+        st.session_state.evaluation_job = None
+        st.rerun()
+    elif status == STATUS_FAILED:
+        st.session_state.evaluation_job = None
+        st.error("評価中にエラーが発生しました。もう一度お試しください。")
+    elif status == STATUS_RUNNING:
+        st.info("AIが採点しています...")
+    else:
+        st.info("採点の順番を待っています...")
+
+
 def main():
     # Display Title with Favicon and Catchphrase using Streamlit's layout
     st.markdown("""
         <h1 class='main-title'>TGF-Scholar</h1>
         <p class='catchphrase'>~Document Your Journey, Define Your Path~</p>
         """, unsafe_allow_html=True)
+
+    # A reloaded tab is logged back in from the session token in its URL
+    restore_user_session()
+
+    # Pages are imported when first shown, so the login screen does not load
+    # pandas, the dashboards or the Firestore SDK
+
+    # Internal latency page, opened with ?admin=telemetry
+    if st.query_params.get('admin') == 'telemetry':
+        from extra_pages.telemetry_admin import telemetry_admin_page
+        set_rerun_page('telemetry_admin')
+        telemetry_admin_page()
     
     # Organization Dashboard
-    if 'organization' in st.session_state and st.session_state.organization:
+    elif 'organization' in st.session_state and st.session_state.organization:
         add_footer()
 
         # Decide which dashboard to show based on the 'full_dashboard' setting
         if st.session_state.organization.get('full_dashboard', False):
+            from extra_pages.full_dashboard import full_org_dashboard
+            set_rerun_page('full_org_dashboard')
             full_org_dashboard() 
         else:
+            from extra_pages.org_dashboard import show_org_dashboard
+            set_rerun_page('org_dashboard')
             show_org_dashboard() 
 
     # User Dashboard
@@ -173,6 +227,9 @@ def main():
         uni_name = user['university']
         faculty_name = user['faculty']  # Fetching faculty instead of program
         department_name = user.get('department', "")  # Handle missing department
+        assistant = get_secret()['Unicke_id']
+        from modules.submissions import build_evaluation_prompt
+        set_rerun_page('student_dashboard')
 
         menu()
 
@@ -187,10 +244,7 @@ def main():
             vocabvan_interface()
 
         txt = get_input()
-        information = f"University: {uni_name}\nFaculty: {faculty_name}\n"
-        if department_name:  # Only include department in information if it exists
-            information += f"Department: {department_name}\n"
-        information += f"\nWriting: {txt}"
+        information = build_evaluation_prompt(uni_name, faculty_name, department_name, txt)
 
         # 提出ボタン
         submit_button = st.button("採点する🚀", type="primary")
@@ -210,7 +264,8 @@ def main():
                     st.write("**志望動機書**:")
                     
                     # Use markdown to display the text in a styled box
-                    box_content = txt.replace('\n', '<br>')
+                    # Escaped: the essay is the student's own input, rendered as HTML
+                    box_content = html.escape(txt).replace('\n', '<br>')
                     st.markdown(f"""
                         <div style="border: 1px solid #ccc; padding: 10px; border-radius: 5px; background-color: #f9f9f9;">
                             {box_content}
@@ -219,14 +274,32 @@ def main():
                     
                     st.write(f'文字数: {len(txt.split())} 文字')
                 
-                st.session_state.feedback = run_assistant(assistant_id=assistant, txt=information, return_content=True, display_chat=False)
-                
-                # Save submission using the dedicated function
-                save_submission(user['id'], txt, uni_name, faculty_name, department_name)
+                # Identical essays are answered from the feedback cache without a new run
+                feedback_key = feedback_cache_key(assistant, uni_name, faculty_name, department_name, txt)
+                cached_feedback = lookup_feedback(feedback_key)
+
+                if cached_feedback:
+                    st.session_state.feedback = cached_feedback
+                    # Clicking again on an unchanged essay does not create a duplicate submission
+                    if st.session_state.last_feedback_key != feedback_key:
+                        save_submission(user['id'], txt, uni_name, faculty_name, department_name)
+                elif EVALUATION_MODE == 'queue':
+                    # Hand the evaluation to the worker process; its status is followed below
+                    st.session_state.evaluation_job = enqueue_evaluation(
+                        assistant, information, user['id'], txt, uni_name, faculty_name, department_name,
+                        feedback_key=feedback_key
+                    )
+                else:
+                    evaluate_inline(assistant, user['id'], txt, information, uni_name, faculty_name, department_name, feedback_key)
+                st.session_state.last_feedback_key = feedback_key
 
             else:
                 st.error("Your account is inactive. You cannot submit evaluations.")
 
+        # Follow a queued evaluation until the worker has written the feedback
+        if st.session_state.evaluation_job:
+            display_evaluation_job()
+
         #Display feedback
         display_feedback()
 
@@ -267,7 +340,7 @@ def main():
                             user, message = login_user(user_id, password)
                             if user:
                                 st.success(message)
-                                st.session_state.user = user
+                                start_user_session(user)
                                 st.rerun()
                             else:
                                 st.error(message)
@@ -292,4 +365,6 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Timings of the external calls made in this run, by page and call site
+    with track_rerun('login'):
+        main()
\ No newline at end of file
@@ -1,6 +1,8 @@
 import streamlit as st
 from setup.firebase_setup import db
-import bcrypt
+from modules.telemetry import span
+from auth.password_pool import hash_password
+from auth.session_token import revoke_user_sessions
 import pytz
 from datetime import datetime
 
@@ -29,7 +31,8 @@ def reset_password(user_id, email, new_password):
     """Resets the user's password after verifying their identity."""
     try:
         user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
+        with span('firestore.reset_password.get_user', reads=1):
+            user_doc = user_ref.get()
 
         if not user_doc.exists:
             st.error("ユーザーが見つかりません。")
@@ -42,13 +45,16 @@ def reset_password(user_id, email, new_password):
             return
 
         # Hash the new password
-        hashed_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
+        hashed_password = hash_password(new_password)
 
         # Update the password in Firestore
-        user_ref.update({
-            'password': hashed_password,
-            'password_reset_at': datetime.now(pytz.utc)
-        })
+        with span('firestore.reset_password.update_password', writes=1):
+            user_ref.update({
+                'password': hashed_password,
+                'password_reset_at': datetime.now(pytz.utc)
+            })
+        # Log out every browser still holding a session from before the reset
+        revoke_user_sessions(user_id)
 
         st.success("パスワードがリセットされました。新しいパスワードでログインしてください。")
     except Exception as e:
@@ -1,7 +1,9 @@
 import streamlit as st
-from firebase_admin import firestore
-import bcrypt
 from setup.firebase_setup import db
+from modules.telemetry import span
+from modules.org_cache import get_org_config, prime_org_config, invalidate_org_config
+from auth.password_pool import check_password, PasswordPoolBusy
+from auth.session_token import create_session, read_session, update_session, revoke_session, SESSION_COOKIE
 from datetime import datetime
 import pytz
 
@@ -30,20 +32,20 @@ def render_org_login_form():
 def login_user(user_id, password):
     """Handles user login authentication with Firestore."""
     try:
-        user_ref = db.collection('users').document(user_id).get()
+        with span('firestore.login_user.get_user', reads=1):
+            user_ref = db.collection('users').document(user_id).get()
         if not user_ref.exists:
             return None, "無効なIDまたはパスワードです"
         
         user_data = user_ref.to_dict()
-        if bcrypt.checkpw(password.encode(), user_data['password'].encode()):
+        if check_password(password, user_data['password']):
             # Fetch organization details to get active_days
             org_code = user_data['org_code']
-            org_ref = db.collection('organizations').document(org_code).get()
+            org_data = get_org_config(org_code)
             
-            if not org_ref.exists:
+            if org_data is None:
                 return None, "教育機関が見つかりません"
 
-            org_data = org_ref.to_dict()
             active_days = org_data.get('active_days', 30)  # Default to 30 if not specified
 
             # Check if the user is still within the 30-day active period
@@ -56,7 +58,8 @@ def login_user(user_id, password):
 
             # Update user status in the database only if it has changed
             if status != user_data['status']:
-                db.collection('users').document(user_id).update({'status': status})
+                with span('firestore.login_user.update_status', writes=1):
+                    db.collection('users').document(user_id).update({'status': status})
             
             return {
                 "id": user_id,
@@ -67,13 +70,92 @@ def login_user(user_id, password):
                 "org_code": user_data['org_code'],
                 'timezone': user_data['timezone'],
                 "status": status,
-                "days_left": days_left
+                "days_left": days_left,
+                "register_at": register_at,
+                "active_days": active_days
             }, "ログインに成功しました"
         else:
             return None, "無効なIDまたはパスワードです"
+    except PasswordPoolBusy as e:
+        return None, str(e)
     except Exception as e:
         return None, f"ログインに失敗しました: {str(e)}"
 
+# Keep the user logged in for this session and, via a cookie, for reloads
+def start_user_session(user):
+    """Stores the logged-in user in session state and starts a server-side login session for the browser."""
+    st.session_state.user = user
+    try:
+        session_id = create_session(user)
+    except Exception as e:
+        # The login still holds for this Streamlit session; only reloads need the cookie
+        print(f"Error creating login session: {e}")
+        return
+    st.session_state.session_id = session_id
+    st.session_state.session_cookie = session_id
+
+# Refresh the stored session user after it changed in session state
+def save_user_session():
+    """Writes the current session user to the login session, so a reload sees the change."""
+    session_id = st.session_state.get('session_id')
+    if session_id:
+        update_session(session_id, st.session_state.user)
+
+def _write_session_cookie():
+    # Cookie changes are made by the browser on the rerun after they are requested,
+    # as a script rendered before st.rerun() may never reach the page
+    if 'session_cookie' not in st.session_state:
+        return
+    session_id = st.session_state.pop('session_cookie')
+    # Streamlit can only set cookies from page script, so the cookie cannot be
+    # HttpOnly and injected script could read it. Student text is therefore
+    # escaped wherever it is rendered as HTML, and a leaked ID stops working
+    # on logout, password reset or expiry.
+    if session_id:
+        # A browser-session cookie (no Max-Age): closing the browser on a shared PC ends it
+        cookie = f"{SESSION_COOKIE}={session_id}; Path=/; Secure; SameSite=Strict"
+    else:
+        cookie = f"{SESSION_COOKIE}=; Path=/; Max-Age=0; Secure; SameSite=Strict"
+    st.html(f"""<script>document.cookie = "{cookie}";</script>""", unsafe_allow_javascript=True)
+
+# Restore a user session from the session cookie
+def restore_user_session():
+    """Logs the session back in from the browser's session cookie. Returns the user or None.
+
+    The cookie is checked once per Streamlit session (one read, no bcrypt).
+    """
+    _write_session_cookie()
+    if st.session_state.get('user'):
+        return st.session_state.user
+    if st.session_state.get('session_checked'):
+        return None
+    st.session_state.session_checked = True
+
+    session_id = st.context.cookies.get(SESSION_COOKIE)
+    if not session_id:
+        return None
+    try:
+        user = read_session(session_id)
+    except Exception as e:
+        print(f"Error reading login session: {e}")
+        return None
+    if user is None:
+        # Expired or revoked; drop the stale cookie
+        st.session_state.session_cookie = None
+        _write_session_cookie()
+        return None
+
+    status, days_left = check_user_status(user['register_at'], user['active_days'])
+    status_changed = status != user['status']
+    user.update({"status": status, "days_left": days_left})
+    st.session_state.user = user
+    st.session_state.session_id = session_id
+    if status_changed:
+        with span('firestore.restore_user_session.update_status', writes=1):
+            db.collection('users').document(user['id']).update({'status': status})
+        save_user_session()
+    return user
+
 # Check if the user is still active
 def check_user_status(register_at, active_days=30):
     """Calculates the user's status based on the registration date and organization's active period."""
@@ -89,17 +171,29 @@ def logout_user():
     """Logs out the user by clearing session state."""
     if 'user' in st.session_state:
         del st.session_state['user']
+    session_id = st.session_state.pop('session_id', None)
+    if session_id:
+        try:
+            revoke_session(session_id)
+        except Exception as e:
+            print(f"Error revoking login session: {e}")
+    # Clear the cookie on the next rerun, and do not restore from the one this session started with
+    st.session_state.session_cookie = None
+    st.session_state.session_checked = True
     return "ログアウトに成功しました"
 
 # Organization login logic
 def login_organization(org_code, password):
     """Handles organization login authentication with Firestore."""
     try:
-        org_ref = db.collection('organizations').document(org_code).get()
+        with span('firestore.login_organization.get_org', reads=1):
+            org_ref = db.collection('organizations').document(org_code).get()
         if not org_ref.exists:
             return None, "無効な教育機関コードまたはパスワードです"
 
         org_data = org_ref.to_dict()
+        # The password check always reads fresh; keep the shared cache current with it
+        prime_org_config(org_code, org_data)
         # Direct comparison for organization password (consider using hashed password for production)
         if org_data['password'] == password:
             return {
@@ -117,5 +211,7 @@ def login_organization(org_code, password):
 def logout_org():
     """Logs out the organization by clearing session state."""
     if 'organization' in st.session_state:
+        # Settings edited in the Firebase console take effect on this instance from the next login
+        invalidate_org_config(st.session_state['organization']['org_code'])
         del st.session_state['organization']
     return "教育機関のログアウトに成功しました"
@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from modules.telemetry import span
+
+# bcrypt is CPU-bound and holds the script thread for ~0.2s per call; run it in
+# worker processes so a burst of logins cannot stall every session on the instance
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', os.cpu_count() or 1))
+# Password checks waiting or running at once; further logins wait up to
+# PASSWORD_QUEUE_TIMEOUT seconds for a slot and are then turned away
+PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', 64))
+PASSWORD_QUEUE_TIMEOUT = 10
+# Upper bound on one check once it has a slot, queueing behind the others included
+PASSWORD_CHECK_TIMEOUT = 30
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when every slot of the password pool stays taken for PASSWORD_QUEUE_TIMEOUT."""
+
+
+def _checkpw(password, hashed):
+    # Runs in a worker process
+    return bcrypt.checkpw(password, hashed)
+
+
+def _hashpw(password):
+    # Runs in a worker process
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+
+def _noop():
+    return None
+
+
+class PasswordPool:
+    """Process pool for bcrypt with a bounded queue and queue-depth counters.
+
+    Workers are started with 'spawn', so they never inherit the gRPC and
+    HTTP clients of the Streamlit process.
+    """
+
+    def __init__(self, workers=PASSWORD_WORKERS, queue_limit=PASSWORD_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._lock = threading.Lock()
+        self._executor = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+
+    def start(self):
+        """Return the executor, creating it on first use."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, site, func, *args):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=PASSWORD_QUEUE_TIMEOUT):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy("処理が混み合っています。しばらくしてから再度お試しください")
+
+        try:
+            with self._lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                queue_depth = self.in_flight
+            with span(site, queue_depth=queue_depth):
+                try:
+                    return self.start().submit(func, *args).result(timeout=PASSWORD_CHECK_TIMEOUT)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM); replace the pool and answer this call inline
+                    with self._lock:
+                        self._executor = None
+                    return func(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_wait_ms += (time.perf_counter() - started) * 1000
+            self._slots.release()
+
+    def warm(self):
+        """Start every worker process now rather than on the first logins.
+
+        Workers are spawned one per task while none is idle, so `workers`
+        no-op tasks are submitted at once.
+        """
+        executor = self.start()
+        for future in [executor.submit(_noop) for _ in range(self.workers)]:
+            future.result(timeout=PASSWORD_CHECK_TIMEOUT)
+
+    def check_password(self, password, hashed):
+        """bcrypt.checkpw on a worker process; raises PasswordPoolBusy when the queue is full."""
+        return self._run('bcrypt.check_password', _checkpw, password.encode(), hashed.encode())
+
+    def hash_password(self, password):
+        """bcrypt.hashpw with a fresh salt on a worker process, returned as str."""
+        return self._run('bcrypt.hash_password', _hashpw, password.encode()).decode()
+
+    def stats(self):
+        """Queue depth now and at its peak, with counts and the mean time per call in ms."""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'mean_ms': round(self.total_wait_ms / self.completed, 1) if self.completed else None,
+            }
+
+
+password_pool = PasswordPool()
+
+
+def check_password(password, hashed):
+    return password_pool.check_password(password, hashed)
+
+
+def hash_password(password):
+    return password_pool.hash_password(password)
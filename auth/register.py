@@ -1,11 +1,11 @@
 import streamlit as st
 from setup.firebase_setup import db
-import bcrypt
+from modules.telemetry import span
+from modules.org_cache import get_org_config
 from datetime import datetime
 import pytz
-import time
-from auth.login_manager import login_user
-from firebase_admin import firestore
+from auth.login_manager import start_user_session
+from auth.password_pool import hash_password
 
 def register_user():
     timezones = pytz.all_timezones
@@ -19,14 +19,19 @@ def register_user():
     if st.session_state.step == 1:
         with st.container(border=True):
             st.subheader("ユーザー情報を設定してください")
+            # Set when the chosen ID was taken between this step and registration
+            if st.session_state.pop('register_error', None):
+                st.error("このIDのユーザーは既に存在します")
             user_id = st.text_input("ユーザーID:")
-            email = st.text_input("メールアドレス:")
+            email = st.text_input("メールアドレス:", value=st.session_state.user_inputs.get('email', ""))
             password = st.text_input("パスワード:", type="password")
 
             if st.button("次へ"):
                 if user_id and email and password:
-                    # Validate user ID doesn't already exist
-                    user_ref = db.collection('users').document(user_id).get()
+                    # An early hint for a taken ID (one read); create() at registration
+                    # still guards against the ID being taken in the meantime
+                    with span('firestore.register.get_user', reads=1):
+                        user_ref = db.collection('users').document(user_id).get()
                     if user_ref.exists:
                         st.error("このIDのユーザーは既に存在します")
                     else:
@@ -44,10 +49,9 @@ def register_user():
             org_code = st.text_input("教育機関コード:")
 
             if org_code:
-                # Fetch organization details from Firestore
-                org_ref = db.collection('organizations').document(org_code).get()
-                if org_ref.exists:
-                    org_data = org_ref.to_dict()
+                # Fetch organization details (cached, so typing does not re-read Firestore)
+                org_data = get_org_config(org_code)
+                if org_data is not None:
                     universities_data = org_data.get("universities", [])
                     university_names = [uni.get("name") for uni in universities_data]
 
@@ -97,32 +101,40 @@ def register_user():
             st.write("**タイムゾーン**: ", st.session_state.user_inputs.get('timezone'))
 
             if st.button("確認して登録"):
-                # Add progress bar to simulate registration process
-                progress_text = "登録処理中...お待ちください。"
-                my_bar = st.progress(0, text=progress_text)
+                progress = st.progress(0, text="登録処理中...お待ちください。")
 
-                for percent_complete in range(100):
-                    time.sleep(0.01)  # Simulate work being done
-                    my_bar.progress(percent_complete + 1, text=progress_text)
-
-                time.sleep(1)  # Pause briefly before continuing
-                my_bar.empty()
+                from google.api_core.exceptions import AlreadyExists  # Loads grpc; kept off the login screen
 
                 # Register user in Firestore
-                register_user_in_firestore(
-                    st.session_state.user_inputs['user_id'],
-                    st.session_state.user_inputs['email'],
-                    st.session_state.user_inputs['password'],
-                    st.session_state.user_inputs['university'],
-                    st.session_state.user_inputs['faculty'],
-                    st.session_state.user_inputs['department'],
-                    st.session_state.user_inputs['org_code'],
-                    st.session_state.user_inputs['timezone']
-                )
-                
-                # Move to step 4 to show only login button
-                st.session_state.step = 4
-                st.rerun()
+                try:
+                    user, message = register_user_in_firestore(
+                        st.session_state.user_inputs['user_id'],
+                        st.session_state.user_inputs['email'],
+                        st.session_state.user_inputs['password'],
+                        st.session_state.user_inputs['university'],
+                        st.session_state.user_inputs['faculty'],
+                        st.session_state.user_inputs['department'],
+                        st.session_state.user_inputs['org_code'],
+                        st.session_state.user_inputs['timezone'],
+                        progress=progress
+                    )
+                except AlreadyExists:
+                    # The ID was taken by someone else; go back and choose another one
+                    del st.session_state.user_inputs['user_id']
+                    st.session_state.register_error = True
+                    st.session_state.step = 1
+                    st.rerun()
+
+                if user:
+                    # The password is no longer needed once it is hashed and stored
+                    del st.session_state.user_inputs['password']
+                    st.session_state.registered_user = user
+                    # Move to step 4 to show only login button
+                    st.session_state.step = 4
+                    st.rerun()
+                else:
+                    progress.empty()
+                    st.error(message)
 
             if st.button("登録し直す"):
                 del st.session_state.user_inputs
@@ -133,45 +145,70 @@ def register_user():
         st.balloons()
 
         if st.button("ログイン"):
-            # Retrieve the stored user info from registration
-            user_id = st.session_state.user_inputs.get('user_id')
-            password = st.session_state.user_inputs.get('password')
-            
-            user, message = login_user(user_id, password)
-        
-            if user:
-                st.success(message)
-                st.session_state.user = user  # Store the logged-in user in session state
-                
-                del st.session_state.user_inputs
-                st.session_state.step = 1
-                st.rerun()  # Reload the page after successful login
-            else:
-                st.error(message)
-            
+            # The user created in step 3 is the session user; no second bcrypt or reads
+            start_user_session(st.session_state.pop('registered_user'))
 
+            del st.session_state.user_inputs
+            st.session_state.step = 1
+            st.rerun()  # Reload the page after successful login
+
+
+def register_user_in_firestore(user_id, email, password, university, faculty, department, org_code, user_timezone, progress=None):
+    """Creates the user document if the ID is free and returns the session user.
+
+    Returns (user, message). Raises AlreadyExists if the ID is already taken.
+    """
+    # Loaded on first registration, not with the login screen
+    from firebase_admin import firestore
+    from google.api_core.exceptions import AlreadyExists
 
-def register_user_in_firestore(user_id, email, password, university, faculty, department, org_code, user_timezone):
     try:
-        hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        if progress is not None:
+            progress.progress(10, text="パスワードを保護しています...")
+        hashed_password = hash_password(password)
 
         # Use UTC timezone-aware datetime for registration timestamp
         register_at = datetime.now(pytz.utc)
-
-        # Create a new user document in Firestore
-        db.collection('users').document(user_id).set({
-            'id': user_id, # for RPA usage
-            'email': email,
-            'password': hashed_password,
-            'university': university,
-            'faculty': faculty,
-            'department': department,
-            'org_code': org_code,
-            'registerAt': register_at,
+        # Cached since step 2, so this normally costs no read
+        org_data = get_org_config(org_code) or {}
+        active_days = org_data.get('active_days', 30)
+
+        if progress is not None:
+            progress.progress(60, text="アカウントを作成しています...")
+        # create() fails if the ID is taken, so uniqueness needs no separate read
+        with span('firestore.register.create_user', writes=1):
+            db.collection('users').document(user_id).create({
+                'id': user_id, # for RPA usage
+                'email': email,
+                'password': hashed_password,
+                'university': university,
+                'faculty': faculty,
+                'department': department,
+                'org_code': org_code,
+                'registerAt': register_at,
+                'timezone': user_timezone,
+                'status': 'Active',
+                'createTime': firestore.SERVER_TIMESTAMP  # Firestore-managed creation time
+            })
+        if progress is not None:
+            progress.progress(100, text="登録が完了しました")
+
+        # Same shape as the user returned by login_user
+        return {
+            "id": user_id,
+            "email": email,
+            "university": university,
+            "faculty": faculty,
+            "department": department,
+            "org_code": org_code,
             'timezone': user_timezone,
-            'status': 'Active',
-            'createTime': firestore.SERVER_TIMESTAMP  # Firestore-managed creation time
-        })
-
+            "status": 'Active',
+            "days_left": active_days,
+            "register_at": register_at,
+            "active_days": active_days
+        }, "登録が完了しました"
+
+    except AlreadyExists:
+        raise
     except Exception as e:
-        st.error(f"登録に失敗しました: {str(e)}")
\ No newline at end of file
+        return None, f"登録に失敗しました: {str(e)}"
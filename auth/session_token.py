@@ -0,0 +1,80 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from secrets import token_urlsafe
+import pytz
+from setup.firebase_setup import db
+from modules.telemetry import span
+from modules.firestore_usage import query_reads
+
+# Login sessions that outlive a Streamlit session (a reload or a new tab).
+# The browser holds a random session ID in a cookie; the session user is kept
+# server-side in sessions/{sha256(ID)}, so logging out or resetting the
+# password revokes it. Expired records can be removed with a Firestore TTL
+# policy on `expires_at`.
+SESSIONS_COLLECTION = 'sessions'
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 4 * 3600))
+SESSION_COOKIE = 'tgf_session'
+
+
+def _session_ref(session_id):
+    # Only the hash is stored, so read access to the database does not yield usable cookies
+    return db.collection(SESSIONS_COLLECTION).document(hashlib.sha256(session_id.encode()).hexdigest())
+
+
+def create_session(user, ttl=SESSION_TTL):
+    """Store the session `user` for `ttl` seconds and return the new session ID."""
+    session_id = token_urlsafe(32)
+    now = datetime.now(pytz.utc)
+    with span('firestore.create_session.set', writes=1):
+        _session_ref(session_id).set({
+            'user_id': user['id'],
+            'user': user,
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=ttl),
+        })
+    return session_id
+
+
+def read_session(session_id):
+    """The session user of an existing, unexpired session, or None."""
+    if not session_id:
+        return None
+    session_ref = _session_ref(session_id)
+    with span('firestore.read_session.get', reads=1):
+        session = session_ref.get()
+    if not session.exists:
+        return None
+
+    data = session.to_dict()
+    if data['expires_at'] <= datetime.now(pytz.utc):
+        with span('firestore.read_session.delete_expired', writes=1):
+            session_ref.delete()
+        return None
+    return data['user']
+
+
+def update_session(session_id, user):
+    """Replace the session user, e.g. after a settings change."""
+    with span('firestore.update_session.update', writes=1):
+        _session_ref(session_id).update({'user': user})
+
+
+def revoke_session(session_id):
+    """End one session (logout)."""
+    with span('firestore.revoke_session.delete', writes=1):
+        _session_ref(session_id).delete()
+
+
+def revoke_user_sessions(user_id):
+    """End every session of a user (password reset). Returns the number revoked."""
+    with span('firestore.revoke_user_sessions.stream') as fields:
+        sessions = list(db.collection(SESSIONS_COLLECTION).where('user_id', '==', user_id).select([]).stream())
+        fields['reads'] = query_reads(len(sessions))
+    if sessions:
+        batch = db.batch()
+        for session in sessions:
+            batch.delete(session.reference)
+        with span('firestore.revoke_user_sessions.commit', writes=len(sessions)):
+            batch.commit()
+    return len(sessions)
@@ -0,0 +1,339 @@
+"""In-memory stand-in for the subset of the Firestore client API the app uses.
+
+Supports collections, documents and subcollections, where/order_by/limit/
+offset/start_after/select queries, collection groups, count() aggregations,
+get_all and write batches. Reads and writes are counted the way Firestore
+bills them, so benchmarks can report document reads next to wall time.
+Transactions are not supported.
+"""
+import copy
+import math
+import threading
+import uuid
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1.transforms import Increment, Sentinel, DELETE_FIELD, SERVER_TIMESTAMP
+from datetime import datetime
+import pytz
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class FakeFirestore:
+    """The fake client; use in place of `firestore.client()`."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._collections = {}  # collection path -> {document id: data}
+        self.reads = 0
+        self.writes = 0
+
+    # ---- client API ----
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def collection_group(self, name):
+        return FakeQuery(self, group=name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths=None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    # ---- bookkeeping used by benchmarks ----
+    def reset_counters(self):
+        self.reads = 0
+        self.writes = 0
+
+    def clear(self):
+        with self._lock:
+            self._collections = {}
+        self.reset_counters()
+
+    def seed(self, path, data):
+        """Store a document without counting a write."""
+        collection_path, doc_id = path.rsplit('/', 1)
+        with self._lock:
+            self._collections.setdefault(collection_path, {})[doc_id] = data
+
+    # ---- storage ----
+    def _get(self, path):
+        collection_path, doc_id = path.rsplit('/', 1)
+        with self._lock:
+            return self._collections.get(collection_path, {}).get(doc_id)
+
+    def _write(self, path, data, merge=False, must_exist=False, must_not_exist=False):
+        collection_path, doc_id = path.rsplit('/', 1)
+        with self._lock:
+            documents = self._collections.setdefault(collection_path, {})
+            current = documents.get(doc_id)
+            if must_exist and current is None:
+                raise NotFound(f"No document to update: {path}")
+            if must_not_exist and current is not None:
+                raise AlreadyExists(f"Document already exists: {path}")
+            base = dict(current) if (merge and current is not None) else {}
+            documents[doc_id] = _apply(base, data)
+            self.writes += 1
+
+    def _delete(self, path):
+        collection_path, doc_id = path.rsplit('/', 1)
+        with self._lock:
+            self._collections.get(collection_path, {}).pop(doc_id, None)
+            self.writes += 1
+
+    def _scan(self, collection_path=None, group=None):
+        with self._lock:
+            if group is None:
+                items = [(collection_path, doc_id, data)
+                         for doc_id, data in self._collections.get(collection_path, {}).items()]
+            else:
+                items = [(path, doc_id, data)
+                         for path, documents in self._collections.items()
+                         if path.rsplit('/', 1)[-1] == group
+                         for doc_id, data in documents.items()]
+        return items
+
+
+def _apply(base, data):
+    for key, value in data.items():
+        target = base
+        parts = key.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        if value is DELETE_FIELD:
+            target.pop(parts[-1], None)
+        elif value is SERVER_TIMESTAMP:
+            target[parts[-1]] = datetime.now(pytz.utc)
+        elif isinstance(value, Increment):
+            target[parts[-1]] = (target.get(parts[-1]) or 0) + value.value
+        elif isinstance(value, Sentinel):
+            raise NotImplementedError(f"Unsupported sentinel: {value}")
+        else:
+            target[parts[-1]] = copy.deepcopy(value)
+    return base
+
+
+def _field(data, field_path):
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and field_paths is not None:
+            data = {field: data[field] for field in field_paths if field in data}
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _field(self._data or {}, field_path)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        self._client.reads += 1
+        return FakeDocumentSnapshot(self, self._client._get(self.path), field_paths)
+
+    def set(self, data, merge=False):
+        self._client._write(self.path, data, merge=merge)
+
+    def update(self, data):
+        self._client._write(self.path, data, merge=True, must_exist=True)
+
+    def create(self, data):
+        self._client._write(self.path, data, must_not_exist=True)
+
+    def delete(self):
+        self._client._delete(self.path)
+
+
+class FakeQuery:
+    def __init__(self, client, collection_path=None, group=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._group = group
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._offset = 0
+        self._start_after = None
+        self._fields = None
+
+    def _copy(self, **changes):
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        for key, value in changes.items():
+            setattr(query, key, value)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        query = self._copy()
+        query._filters.append((field_path, _OPERATORS[op_string], value))
+        return query
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        query = self._copy()
+        query._orders.append((field_path, direction == 'DESCENDING'))
+        return query
+
+    def limit(self, count):
+        return self._copy(_limit=count)
+
+    def offset(self, num_to_skip):
+        return self._copy(_offset=num_to_skip)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(_start_after=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(_fields=list(field_paths))
+
+    def _matches(self):
+        rows = []
+        for collection_path, doc_id, data in self._client._scan(self._collection_path, self._group):
+            if all(op(_field(data, field), value) for field, op, value in self._filters):
+                rows.append((f"{collection_path}/{doc_id}", data))
+
+        # Firestore excludes documents missing an order_by field
+        for field, _ in self._orders:
+            rows = [row for row in rows if _field(row[1], field) is not None]
+        for field, descending in reversed(self._orders):
+            rows.sort(key=lambda row: _field(row[1], field), reverse=descending)
+        if not self._orders:
+            rows.sort(key=lambda row: row[0])
+        return rows
+
+    def _cursor_index(self, rows):
+        cursor = self._start_after
+        path = getattr(getattr(cursor, 'reference', None), 'path', None)
+        if path is not None:
+            for idx, (row_path, _) in enumerate(rows):
+                if row_path == path:
+                    return idx + 1
+            cursor = cursor.to_dict()
+        if isinstance(cursor, dict):
+            cursor = [_field(cursor, field) for field, _ in self._orders]
+        for idx, (_, data) in enumerate(rows):
+            key = [_field(data, field) for field, _ in self._orders]
+            if all((k < c) if descending else (k > c)
+                   for k, c, (_, descending) in zip(key, cursor, self._orders)):
+                return idx
+        return len(rows)
+
+    def stream(self, transaction=None):
+        rows = self._matches()
+        if self._start_after is not None:
+            rows = rows[self._cursor_index(rows):]
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        # Billed one read per document, and one read for an empty result
+        self._client.reads += max(len(rows), 1)
+        for path, data in rows:
+            yield FakeDocumentSnapshot(FakeDocumentReference(self._client, path), data, self._fields)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self, alias)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, collection_path=path)
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        """The document holding this subcollection, or None for a top-level collection."""
+        if '/' not in self.path:
+            return None
+        return FakeDocumentReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return datetime.now(pytz.utc), reference
+
+
+class _AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias or 'count'
+
+    def get(self, transaction=None):
+        matched = len(self._query._matches())
+        # Billed one read per 1,000 index entries counted
+        self._query._client.reads += max(math.ceil(matched / 1000), 1)
+        return [[_AggregationResult(self._alias, matched)]]
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(lambda: reference.set(document_data, merge=merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append(lambda: reference.update(field_updates))
+
+    def create(self, reference, document_data):
+        self._writes.append(lambda: reference.create(document_data))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        with self._client._lock:
+            for write in self._writes:
+                write()
+        self._writes = []
@@ -0,0 +1,205 @@
+"""Local stand-in for the OpenAI Assistants API with configurable latency.
+
+Serves the endpoints run_assistant and complete_assistant use: assistant
+retrieval, threads, messages, runs (polled or streamed as server-sent events)
+and run cancellation, plus chat completions. Point the OpenAI client at it
+with OPENAI_BASE_URL=server.base_url.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server answering every run with `tokens` words.
+
+    `latency` is the delay before a run starts producing text and
+    `token_delay` the delay between streamed tokens, both in seconds.
+    """
+
+    def __init__(self, latency=0.0, token_delay=0.0, tokens=50, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self._runs = {}  # run id -> run dict
+        self._messages = {}  # thread id -> list of message dicts
+        self._lock = threading.Lock()
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # ---- API objects ----
+    def answer(self):
+        return " ".join(f"token{i}" for i in range(self.tokens))
+
+    def _message(self, thread_id, role, text, run_id=None, status='completed'):
+        return {
+            'id': _new_id('msg'), 'object': 'thread.message', 'created_at': int(time.time()),
+            'thread_id': thread_id, 'role': role, 'run_id': run_id, 'assistant_id': None,
+            'status': status, 'attachments': [], 'metadata': {},
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}] if text else [],
+        }
+
+    def _run(self, thread_id, assistant_id):
+        run = {
+            'id': _new_id('run'), 'object': 'thread.run', 'created_at': int(time.time()),
+            'thread_id': thread_id, 'assistant_id': assistant_id, 'status': 'queued',
+            'model': 'gpt-4o', 'instructions': '', 'tools': [], 'metadata': {},
+            'last_error': None, 'required_action': None,
+            '_started': time.monotonic(),
+        }
+        with self._lock:
+            self._runs[run['id']] = run
+        return run
+
+    def _run_status(self, run):
+        if run['status'] in ('queued', 'in_progress'):
+            elapsed = time.monotonic() - run['_started']
+            if elapsed >= self.latency + self.tokens * self.token_delay:
+                run['status'] = 'completed'
+                self._add_answer(run)
+            elif elapsed >= self.latency:
+                run['status'] = 'in_progress'
+        return {key: value for key, value in run.items() if not key.startswith('_')}
+
+    def _add_answer(self, run):
+        with self._lock:
+            self._messages.setdefault(run['thread_id'], []).append(
+                self._message(run['thread_id'], 'assistant', self.answer(), run['id']))
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_event(self, event, data):
+                chunk = f"event: {event}\ndata: {json.dumps(data) if not isinstance(data, str) else data}\n\n".encode()
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+
+            def _stream_run(self, thread_id, assistant_id):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                run = server._run(thread_id, assistant_id)
+                self._send_event('thread.run.created', server._run_status(run))
+                time.sleep(server.latency)
+                run['status'] = 'in_progress'
+                self._send_event('thread.run.in_progress', server._run_status(run))
+
+                message = server._message(thread_id, 'assistant', '', run['id'], status='in_progress')
+                self._send_event('thread.message.created', message)
+                for i in range(server.tokens):
+                    if server.token_delay:
+                        time.sleep(server.token_delay)
+                    delta = {'content': [{'index': 0, 'type': 'text', 'text': {'value': f"token{i}" + (" " if i < server.tokens - 1 else "")}}]}
+                    self._send_event('thread.message.delta', {'id': message['id'], 'object': 'thread.message.delta', 'delta': delta})
+                if run['status'] == 'cancelled':
+                    self._send_event('thread.run.cancelled', server._run_status(run))
+                else:
+                    run['status'] = 'completed'
+                    server._add_answer(run)
+                    self._send_event('thread.message.completed', server._messages[thread_id][-1])
+                    self._send_event('thread.run.completed', server._run_status(run))
+                self._send_event('done', '[DONE]')
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                server.requests += 1
+                path = self.path.split('?')[0]
+                if match := re.fullmatch(r'/v1/assistants/([^/]+)', path):
+                    return self._send_json({
+                        'id': match[1], 'object': 'assistant', 'created_at': int(time.time()), 'name': 'bench',
+                        'model': 'gpt-4o', 'instructions': 'Benchmark assistant.', 'tools': [], 'metadata': {},
+                    })
+                if match := re.fullmatch(r'/v1/threads/([^/]+)/runs/([^/]+)', path):
+                    run = server._runs.get(match[2])
+                    return self._send_json(server._run_status(run)) if run else self._send_json({'error': {'message': 'No run'}}, 404)
+                if match := re.fullmatch(r'/v1/threads/([^/]+)/messages', path):
+                    messages = list(reversed(server._messages.get(match[1], [])))  # Newest first, like the API
+                    return self._send_json({'object': 'list', 'data': messages, 'has_more': False,
+                                            'first_id': None, 'last_id': None})
+                self._send_json({'error': {'message': f'Unknown path {path}'}}, 404)
+
+            def do_POST(self):
+                server.requests += 1
+                path = self.path.split('?')[0]
+                body = self._body()
+                if path == '/v1/threads':
+                    thread_id = _new_id('thread')
+                    server._messages[thread_id] = []
+                    return self._send_json({'id': thread_id, 'object': 'thread', 'created_at': int(time.time()), 'metadata': {}})
+                if match := re.fullmatch(r'/v1/threads/([^/]+)/messages', path):
+                    content = body.get('content')
+                    message = server._message(match[1], body.get('role', 'user'), content if isinstance(content, str) else '')
+                    with server._lock:
+                        server._messages.setdefault(match[1], []).append(message)
+                    return self._send_json(message)
+                if match := re.fullmatch(r'/v1/threads/([^/]+)/runs', path):
+                    if body.get('stream'):
+                        return self._stream_run(match[1], body.get('assistant_id'))
+                    return self._send_json(server._run_status(server._run(match[1], body.get('assistant_id'))))
+                if match := re.fullmatch(r'/v1/threads/([^/]+)/runs/([^/]+)/cancel', path):
+                    run = server._runs.get(match[2])
+                    if run is None:
+                        return self._send_json({'error': {'message': 'No run'}}, 404)
+                    if run['status'] in ('queued', 'in_progress'):
+                        run['status'] = 'cancelled'
+                    return self._send_json(server._run_status(run))
+                if path == '/v1/chat/completions':
+                    time.sleep(server.latency + server.tokens * server.token_delay)
+                    return self._send_json({
+                        'id': _new_id('chatcmpl'), 'object': 'chat.completion', 'created': int(time.time()),
+                        'model': body.get('model', 'gpt-4o'),
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': server.answer()}}],
+                    })
+                self._send_json({'error': {'message': f'Unknown path {path}'}}, 404)
+
+        return Handler
@@ -0,0 +1,101 @@
+"""Install the in-memory fakes in place of Firestore, Secret Manager and OpenAI.
+
+Call install_fakes() before the app makes its first Firestore, Secret
+Manager or OpenAI call; app modules create those clients on first use.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+import bcrypt
+import pytz
+from bench.fake_firestore import FakeFirestore
+
+BENCH_ASSISTANT_ID = 'asst_bench'
+BENCH_SECRETS = {
+    'api_key': 'sk-bench',
+    'Unicke_id': BENCH_ASSISTANT_ID,
+    'AI_uKnow': BENCH_ASSISTANT_ID,
+    'Friedrich_Sartre': BENCH_ASSISTANT_ID,
+}
+BENCH_PASSWORD = 'bench-password'
+BENCH_TIMEZONE = 'Asia/Tokyo'
+
+
+def install_fakes(openai_base_url=None):
+    """Swap in the fakes and return the FakeFirestore every app module will use."""
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    from setup.secret_cache import secret_cache
+    from setup import firebase_setup
+    from modules.modules import APP_SECRET_NAME
+
+    # Bare mode logs a ScriptRunContext warning on every st call. Parse the
+    # config first, or the first st call resets the level to the default.
+    config.get_option('logger.level')
+    set_log_level('error')
+    if openai_base_url:
+        os.environ['OPENAI_BASE_URL'] = openai_base_url
+
+    secret_cache.prime(APP_SECRET_NAME, BENCH_SECRETS)
+    secret_cache.prime(firebase_setup.FIREBASE_SECRET_NAME, {})
+
+    # The lazy `db` every app module imported resolves to this client from now on
+    db = FakeFirestore()
+    firebase_setup._client = db
+    return db
+
+
+def seed_organization(db, org_code, num_users, num_submissions, legacy_fraction=0.0, seed=0):
+    """Create an organization with users and submissions spread over the last 90 days.
+
+    `legacy_fraction` of the users have no submission counters, like users
+    who registered before counters existed. Returns the user IDs.
+    """
+    from modules.submissions import build_submission
+
+    rng = random.Random(seed)
+    now = datetime.now(pytz.utc)
+    tz = pytz.timezone(BENCH_TIMEZONE)
+    today = now.astimezone(tz).strftime('%Y-%m-%d')
+    # Every user shares one hash; hashing thousands of passwords would dominate seeding
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt()).decode()
+
+    db.seed(f"organizations/{org_code}", {
+        'org_name': f"Benchmark {org_code}", 'password': BENCH_PASSWORD, 'timezone': BENCH_TIMEZONE,
+        'active_days': 30, 'full_dashboard': True, 'sartre': True,
+    })
+
+    users = {}
+    for i in range(num_users):
+        user_id = f"{org_code}-user{i:05d}"
+        users[user_id] = {
+            'email': f"{user_id}@example.com", 'password': password_hash, 'university': '東京大学',
+            'faculty': '法学部', 'department': '', 'org_code': org_code, 'timezone': BENCH_TIMEZONE,
+            'registerAt': now - timedelta(days=rng.uniform(0, 60)), 'status': 'Active',
+        }
+
+    user_ids = list(users)
+    counters = {user_id: [0, 0, None] for user_id in user_ids}  # total, today, last submit time
+    text = "志望動機の本文です。" * 40
+    feedback = "添削結果です。" * 60
+    for i in range(num_submissions):
+        user_id = rng.choice(user_ids)
+        submit_time = now - timedelta(days=rng.uniform(0, 90))
+        db.seed(f"users/{user_id}/submissions/sub{i:06d}",
+                build_submission(users[user_id], text, '東京大学', '法学部', '', feedback, submit_time))
+        counter = counters[user_id]
+        counter[0] += 1
+        if submit_time.astimezone(tz).strftime('%Y-%m-%d') == today:
+            counter[1] += 1
+        if counter[2] is None or submit_time > counter[2]:
+            counter[2] = submit_time
+
+    for user_id, user_data in users.items():
+        if rng.random() >= legacy_fraction:
+            total, todays, last_submit_time = counters[user_id]
+            user_data.update({
+                'submission_count': total, 'daily_submission_date': today,
+                'daily_submission_count': todays, 'last_submit_time': last_submit_time,
+            })
+        db.seed(f"users/{user_id}", user_data)
+    return user_ids
@@ -0,0 +1,93 @@
+"""Fail when importing the app gets slower or starts doing work at import time.
+
+Usage:
+    python -m bench.import_budget [--budget-ms 800] [--runs 5]
+
+Imports app.py in fresh interpreters, the way a cold container starts, and
+reports the median time spent importing it after Streamlit itself. Exits
+non-zero when the median exceeds the budget, when a module listed in
+DEFERRED_MODULES was imported, or when the import created the Firestore or
+OpenAI client or fetched a secret. No credentials or network are needed:
+a clean import touches neither.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Heavy SDKs the login screen must not load; each is imported on first use
+DEFERRED_MODULES = (
+    'openai',
+    'pandas',
+    'pyarrow',
+    'firebase_admin',
+    'google.cloud.firestore',
+    'google.cloud.secretmanager',
+    'google.api_core.exceptions',
+)
+
+DEFAULT_BUDGET_MS = 800
+
+_PROBE = """
+import json, sys, time
+import streamlit
+from streamlit import config
+from streamlit.logger import set_log_level
+config.get_option('logger.level')
+set_log_level('error')
+
+started = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - started) * 1000
+
+from setup import firebase_setup
+from setup.secret_cache import secret_cache
+from modules import modules
+print(json.dumps({
+    'import_ms': import_ms,
+    'loaded': [name for name in %r if name in sys.modules],
+    'firestore_client': firebase_setup._client is not None,
+    'openai_client': modules._client is not None,
+    'secrets_fetched': sorted(secret_cache._entries),
+}))
+""" % (DEFERRED_MODULES,)
+
+
+def probe():
+    """Import the app in a fresh interpreter and return what the probe reports."""
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', _PROBE], cwd=repo_root,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app.py failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of app.py against a budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Median import time allowed (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to import in; the median is checked")
+    args = parser.parse_args()
+
+    reports = [probe() for _ in range(args.runs)]
+    median_ms = statistics.median(report['import_ms'] for report in reports)
+    report = reports[-1]
+    print(f"import app: median {median_ms:.0f}ms over {args.runs} runs (budget {args.budget_ms:.0f}ms)")
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"import took {median_ms:.0f}ms, over the {args.budget_ms:.0f}ms budget")
+    if report['loaded']:
+        failures.append(f"imported at startup: {', '.join(report['loaded'])}")
+    if report['firestore_client']:
+        failures.append("the Firestore client was created at import")
+    if report['openai_client']:
+        failures.append("the OpenAI client was created at import")
+    if report['secrets_fetched']:
+        failures.append(f"secrets fetched at import: {', '.join(report['secrets_fetched'])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,121 @@
+"""Benchmark the dashboard, login and assistant paths against in-memory fakes.
+
+Usage:
+    python -m bench.run_benchmarks [--scenarios 100x10,1000x10000] [--repeat 3]
+                                   [--openai-latency 0.2] [--openai-token-delay 0.01]
+                                   [--legacy-fraction 0.2] [--json results.json]
+
+A scenario `UxS` seeds one organization with U users and S submissions. For
+every operation the median wall time and the Firestore documents read and
+written per call are reported.
+"""
+import argparse
+import json
+import statistics
+import time
+from bench.fake_openai import FakeOpenAIServer
+from bench.harness import install_fakes, seed_organization, BENCH_ASSISTANT_ID, BENCH_PASSWORD, BENCH_TIMEZONE
+
+DEFAULT_SCENARIOS = '100x10,100x1000,1000x10000,10000x100000'
+
+
+def measure(db, func, repeat=1):
+    """Run `func` `repeat` times; return the median seconds and the reads/writes of one call."""
+    timings = []
+    reads = writes = 0
+    for _ in range(repeat):
+        db.reset_counters()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+        reads, writes = db.reads, db.writes
+    return {'seconds': statistics.median(timings), 'reads': reads, 'writes': writes}
+
+
+def run_dashboard_scenario(db, num_users, num_submissions, repeat, legacy_fraction):
+    import streamlit as st
+    from extra_pages.dashboard_common import get_user_data, fetch_org_submissions
+    from extra_pages.full_dashboard import fetch_submission_data, fetch_submissions
+    from auth.login_manager import login_user
+
+    org_code = f"bench{num_users}x{num_submissions}"
+    started = time.perf_counter()
+    user_ids = seed_organization(db, org_code, num_users, num_submissions, legacy_fraction)
+    print(f"\n{org_code}: seeded {num_users} users and {num_submissions} submissions in {time.perf_counter() - started:.1f}s")
+
+    st.session_state['organization'] = {'org_code': org_code, 'timezone': BENCH_TIMEZONE}
+    busiest_user = max(user_ids, key=lambda user_id: len(list(
+        db._scan(f"users/{user_id}/submissions"))))
+    results = {}
+
+    # The org store is process-wide: the first call is the full pass, later ones incremental
+    results['fetch_org_submissions (cold)'] = measure(db, lambda: fetch_org_submissions(org_code))
+    results['fetch_org_submissions (warm)'] = measure(db, lambda: fetch_org_submissions(org_code), repeat)
+    submissions = fetch_org_submissions(org_code)
+    if len(submissions) != num_submissions:
+        raise RuntimeError(f"Expected {num_submissions} submissions from the org store, got {len(submissions)}")
+
+    results['get_user_data (count queries)'] = measure(db, get_user_data, repeat)
+    results['get_user_data (org submissions)'] = measure(db, lambda: get_user_data(submissions), repeat)
+    results['fetch_submission_data'] = measure(db, lambda: fetch_submission_data(submissions), repeat)
+    results['fetch_submissions (page 1)'] = measure(db, lambda: fetch_submissions(busiest_user), repeat)
+    cursor = fetch_submissions(busiest_user)[2]
+    if cursor is not None:
+        results['fetch_submissions (page 2)'] = measure(db, lambda: fetch_submissions(busiest_user, start_after=cursor), repeat)
+    results['login_user'] = measure(db, lambda: login_user(user_ids[0], BENCH_PASSWORD), repeat)
+    return results
+
+
+def run_assistant_scenario(db, repeat):
+    from modules.modules import run_assistant, preload_assistants
+
+    preload_assistants()
+    results = {}
+    results['run_assistant (stream)'] = measure(db, lambda: run_assistant(
+        BENCH_ASSISTANT_ID, "benchmark essay", return_content=True, display_chat=False), repeat)
+    results['run_assistant (poll)'] = measure(db, lambda: run_assistant(
+        BENCH_ASSISTANT_ID, "benchmark essay", return_content=True, display_chat=False, stream=False), repeat)
+    return results
+
+
+def print_results(name, results):
+    print(f"{'':2}{'operation':<36}{'ms':>10}{'reads':>10}{'writes':>8}")
+    for operation, result in results.items():
+        print(f"{'':2}{operation:<36}{result['seconds'] * 1000:>10.1f}{result['reads']:>10}{result['writes']:>8}")
+
+
+def parse_scenarios(value):
+    scenarios = []
+    for item in value.split(','):
+        users, submissions = item.lower().split('x')
+        scenarios.append((int(users), int(submissions)))
+    return scenarios
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the app against in-memory Firestore and a fake OpenAI server.")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="Comma-separated USERSxSUBMISSIONS (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per operation; the median is reported")
+    parser.add_argument("--legacy-fraction", type=float, default=0.2, help="Share of users without submission counters")
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="Seconds before a run produces text")
+    parser.add_argument("--openai-token-delay", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--openai-tokens", type=int, default=50, help="Tokens per answer")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    all_results = {}
+    with FakeOpenAIServer(args.openai_latency, args.openai_token_delay, args.openai_tokens) as server:
+        db = install_fakes(server.base_url)
+
+        for num_users, num_submissions in parse_scenarios(args.scenarios):
+            name = f"{num_users}x{num_submissions}"
+            all_results[name] = run_dashboard_scenario(db, num_users, num_submissions, args.repeat, args.legacy_fraction)
+            print_results(name, all_results[name])
+
+        print(f"\nassistant (latency {args.openai_latency}s, {args.openai_tokens} tokens every {args.openai_token_delay}s)")
+        all_results['assistant'] = run_assistant_scenario(db, args.repeat)
+        print_results('assistant', all_results['assistant'])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
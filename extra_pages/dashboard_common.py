@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import pytz
 from setup.firebase_setup import db
-from modules.modules import convert_to_timezone
+from modules.telemetry import span
+from modules.firestore_usage import query_reads
+from modules.modules import convert_to_timezone, convert_series_to_timezone
+from modules.org_aggregates import get_org_store
+from modules.submissions import counter_timezone
+from modules.dashboard_cache import dashboard_cache_age, dashboard_cache_stats, invalidate_dashboard, DASHBOARD_CACHE_TTL
+from .metrics import count_org_registrations, count_user_submissions, local_day_bounds, local_month_bounds
 
 # Custom CSS for styling the dashboard
 def apply_custom_css():
@@ -45,76 +51,149 @@ def display_org_header():
     st.markdown(f"<h1 class='big-font'>{organization['org_name']}</h1>", unsafe_allow_html=True)
     st.markdown(f"<p><strong>教育機関コード:</strong> {organization['org_code']}</p>", unsafe_allow_html=True)
 
+# Show how fresh the cached dashboard data is and allow a manual refresh
+def display_cache_status(org_code, kind):
+    age = dashboard_cache_age(org_code, kind) or 0
+    stats = dashboard_cache_stats()
+
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.caption(f"データ取得: {int(age)}秒前（{DASHBOARD_CACHE_TTL}秒ごとに更新） · キャッシュヒット率: {stats['hit_rate']:.0%}")
+    with col2:
+        if st.button("🔄 最新の情報に更新", key="refresh_dashboard"):
+            invalidate_dashboard(org_code)
+            st.session_state.pop('submission_history', None)
+            st.rerun()
+
+# Fetch every submission of an organization in one pass
+def fetch_org_submissions(org_code):
+    """Fetch all submissions of an organization (submit_time only).
+
+    Served from the organization's in-process submission store, which only
+    queries submissions newer than its watermark after the first load.
+    Returns a list of (user_id, submission dict) pairs, shared by get_user_data
+    and fetch_submission_data so a dashboard render reads submissions once.
+    Errors are raised, so a failed read never ends up in the dashboard cache.
+    """
+    store = get_org_store(org_code)
+    store.refresh()
+    return store.submissions()
+
+def display_load_error(e):
+    """Show a dashboard loading error to the admin."""
+    if 'indexes?create_composite' in str(e):
+        # Provide a user-friendly message about missing indexes
+        st.error("提出データを取得するために必要な設定が完了していません。Nuginyサポートにお問い合わせください。")
+    else:
+        st.error(f"ダッシュボードの読み込み中にエラーが発生しました: {str(e)}")
+
+def build_submissions_frame(submissions, timezone_str):
+    """Data frame of (user_id, submit_time) pairs with admin-local timestamps and dates.
+
+    Times are converted in one vectorized pass; submissions without a
+    submit_time are dropped.
+    """
+    df = pd.DataFrame(
+        [(user_id, sub_data.get('submit_time')) for user_id, sub_data in submissions],
+        columns=['user_id', 'submit_time']
+    )
+    df['timestamp'] = convert_series_to_timezone(df['submit_time'], timezone_str)
+    df = df[df['timestamp'].notna()].reset_index(drop=True)
+    df['date'] = df['timestamp'].dt.date
+    return df
+
 # Fetch user data and update statuses
-def get_user_data():
-    """Fetch user data, calculate metrics, and update user statuses if necessary."""
+def get_user_data(submissions=None):
+    """Fetch user data, calculate metrics, and update user statuses if necessary.
+
+    Submission totals come from the user counters. Users without counters are
+    counted from `submissions` (the result of fetch_org_submissions) when
+    given, and with count() aggregation queries otherwise.
+    """
     organization = st.session_state.organization
     org_code = organization['org_code']
     admin_timezone_str = organization.get('timezone', 'UTC')
     
     users_ref = db.collection('users').where('org_code', '==', org_code)
-    users = users_ref.stream()
+    with span('firestore.get_user_data.stream_users') as fields:
+        users = list(users_ref.stream())
+        fields['reads'] = query_reads(len(users))
+    user_dicts = [user.to_dict() for user in users]
 
     # Get the current date in admin's timezone
     current_date_in_admin_timezone = convert_to_timezone(datetime.now(pytz.utc), admin_timezone_str)
-
-    registrations_this_month = 0
+    today_in_admin_timezone = current_date_in_admin_timezone.date()  # Admin's local date
+    # The day the daily counters are bucketed by, from the same org config write_submission reads
+    counter_today = convert_to_timezone(datetime.now(pytz.utc), counter_timezone(org_code)).strftime('%Y-%m-%d')
+
+    # Convert all registration dates to admin's timezone at once and derive expiration and status
+    register_times = convert_series_to_timezone([user_dict.get('registerAt') for user_dict in user_dicts], admin_timezone_str)
+    expiration_dates = register_times + pd.Timedelta(days=30)
+    is_active = (expiration_dates > current_date_in_admin_timezone).fillna(False)
+    register_strs = register_times.dt.strftime('%Y-%m-%d').fillna('不明')
+    expiration_strs = expiration_dates.dt.strftime('%Y-%m-%d').fillna('不明')
+
+    # Registrations this month in admin's timezone, counted server-side
+    registrations_this_month = count_org_registrations(org_code, *local_month_bounds(admin_timezone_str))
     active_users = 0
     user_data = []
     batch = db.batch()  # Initialize Firestore batch for updates
+    status_updates = 0
 
-    for user in users:
-        user_dict = user.to_dict()
+    for idx, (user, user_dict) in enumerate(zip(users, user_dicts)):
         user_id = user.id
-        register_at = user_dict.get('registerAt')
-        
-        # Convert registration date to admin's timezone
-        if isinstance(register_at, datetime):
-            register_at = convert_to_timezone(register_at, admin_timezone_str)
-
-        # Check if the user registered this month in admin's timezone
-        if register_at and register_at.month == current_date_in_admin_timezone.month and register_at.year == current_date_in_admin_timezone.year:
-            registrations_this_month += 1
-
-        # Determine the user's expiration date and status, converting to admin's timezone
-        expiration_date = register_at + timedelta(days=30) if register_at else None
-        status = 'Active' if expiration_date and current_date_in_admin_timezone < expiration_date else 'Inactive'
+        status = 'Active' if is_active[idx] else 'Inactive'
         
         # If the status has changed, update it in Firestore using batch
         if status != user_dict.get('status'):
             user_ref = db.collection('users').document(user_id)
             batch.update(user_ref, {'status': status})
+            status_updates += 1
 
         # Only add active users to the data list
         if status == 'Active':
             active_users += 1
 
-            # Calculate total submissions and today's submissions in admin's timezone
-            submission_ref = db.collection('users').document(user_id).collection('submissions').stream()
-            total_submissions = 0
-            todays_submissions = 0
-            today_in_admin_timezone = current_date_in_admin_timezone.date()  # Admin's local date
-
-            for submission in submission_ref:
-                sub_data = submission.to_dict()
-                submit_time = sub_data.get('submit_time')
-
-                if submit_time:
-                    submit_time = convert_to_timezone(submit_time, admin_timezone_str)
-                    total_submissions += 1
-                    if submit_time.date() == today_in_admin_timezone:
-                        todays_submissions += 1
+            if 'submission_count' in user_dict:
+                # Counters maintained by write_submission; no submission reads needed
+                total_submissions = user_dict.get('submission_count', 0)
+                todays_submissions = (
+                    user_dict.get('daily_submission_count', 0)
+                    if user_dict.get('daily_submission_date') == counter_today
+                    else 0
+                )
+            else:
+                # Users without counters yet are counted from the org-wide submissions pass below
+                total_submissions = todays_submissions = None
 
             user_data.append({
                 'User ID': user_id,
-                'registerAt': register_at.strftime('%Y-%m-%d') if register_at else '不明',
-                'Expiration Date': expiration_date.strftime('%Y-%m-%d') if expiration_date else '不明',
+                'registerAt': register_strs[idx],
+                'Expiration Date': expiration_strs[idx],
                 'total_submission': total_submissions,
                 'todays_submission': todays_submissions,
             })
 
+    uncounted_users = [row for row in user_data if row['total_submission'] is None]
+    if uncounted_users and submissions is not None:
+        # Count from the org-wide submissions pass the caller already made
+        submissions_df = build_submissions_frame(submissions, admin_timezone_str)
+        totals = submissions_df.groupby('user_id').size()
+        todays = submissions_df[submissions_df['date'] == today_in_admin_timezone].groupby('user_id').size()
+
+        for row in uncounted_users:
+            row['total_submission'] = int(totals.get(row['User ID'], 0))
+            row['todays_submission'] = int(todays.get(row['User ID'], 0))
+    elif uncounted_users:
+        # Otherwise count server-side instead of downloading their submissions
+        today_start, today_end = local_day_bounds(admin_timezone_str)
+        for row in uncounted_users:
+            row['total_submission'] = count_user_submissions(row['User ID'])
+            row['todays_submission'] = count_user_submissions(row['User ID'], today_start, today_end)
+
     # Commit all updates to Firestore at once
-    batch.commit()
+    with span('firestore.get_user_data.commit_statuses', writes=status_updates):
+        batch.commit()
 
     return user_data, registrations_this_month, active_users
 
@@ -1,71 +1,37 @@
+import html
 import streamlit as st
 import pandas as pd
 import pytz
 from firebase_admin import firestore
-from .dashboard_common import apply_custom_css, display_org_header, get_user_data, display_active_users_table
+from .dashboard_common import apply_custom_css, display_org_header, get_user_data, display_active_users_table, fetch_org_submissions, display_cache_status, build_submissions_frame, display_load_error
+from modules.dashboard_cache import get_dashboard_data
 from auth.login_manager import logout_org
 from datetime import datetime
 from setup.firebase_setup import db
-from modules.modules import convert_to_timezone
+from modules.telemetry import span
+from modules.firestore_usage import query_reads
+from modules.modules import convert_series_to_timezone
+from jobs.bulk_evaluation import load_rows, evaluate_batch, DEFAULT_CONCURRENCY, MAX_CONCURRENCY
 
 
 
-# Fetch submission data using a collection group query
-def fetch_submission_data():
-    """Fetch submission data for all users in an organization."""
+# Build the submission data frame from the organization's submissions
+def fetch_submission_data(submissions):
+    """Prepare submission data for all users in an organization.
+
+    `submissions` is the list returned by fetch_org_submissions. Empty when
+    there are no (valid) submissions.
+    """
     organization = st.session_state['organization']
-    org_code = organization['org_code']
     admin_timezone_str = organization.get('timezone', 'UTC')
-
-    submissions = []
-    try:
-        # Query all submissions where 'org_code' matches
-        submissions_ref = db.collection_group('submissions').where('org_code', '==', org_code)
-        submissions_list = list(submissions_ref.stream())
-
-        if not submissions_list:
-            # No submissions found for the organization
-            return pd.DataFrame()  # Return an empty DataFrame without error
-
-        for submission in submissions_list:
-            sub_data = submission.to_dict()
-            submit_time = sub_data.get('submit_time')
-
-            if submit_time and isinstance(submit_time, datetime):
-                # Use the utility function to convert the UTC submit_time to the admin's timezone
-                submit_time_in_admin_timezone = convert_to_timezone(submit_time, admin_timezone_str)
-                
-                sub_data.update({
-                    'user_id': submission.reference.parent.parent.id,  # Get user ID from parent document
-                    'timestamp': submit_time_in_admin_timezone,
-                    'date': submit_time_in_admin_timezone.date()
-                })
-                submissions.append(sub_data)
-            else:
-                pass  # Skip submissions without 'submit_time'
-
-    except Exception as e:
-        error_message = str(e)
-        if 'indexes?create_composite' in error_message:
-            # Provide a user-friendly message about missing indexes
-            st.error("提出データを取得するために必要な設定が完了していません。Nuginyサポートにお問い合わせください。")
-            return pd.DataFrame()
-        else:
-            # For other exceptions, display a general error message
-            st.error("エラーが発生しました。Nuginyサポートにお問い合わせください。")
-            return pd.DataFrame()
-
-    if submissions:
-        return pd.DataFrame(submissions)
-    else:
-        # No valid submissions after processing
-        return pd.DataFrame()
+    return build_submissions_frame(submissions, admin_timezone_str)
     
 # Function to fetch user details
 def fetch_user_details(user_id):
     """Fetch user details like university, faculty, and department."""
     user_ref = db.collection('users').document(user_id)
-    user_doc = user_ref.get()
+    with span('firestore.fetch_user_details.get_user', reads=1):
+        user_doc = user_ref.get()
     if user_doc.exists:
         user_data = user_doc.to_dict()
         university = user_data.get('university', '')
@@ -75,46 +41,75 @@ def fetch_user_details(user_id):
         university = faculty = department = ''
     return university, faculty, department
 
+# Fields the submission list needs; full bodies are loaded per submission
+SUBMISSION_LIST_FIELDS = ['submit_time', 'text_preview', 'feedback_preview', 'text_length', 'feedback_length']
+
+# Number of submissions loaded per page of the history table
+SUBMISSION_PAGE_SIZE = 20
+
 # Function to fetch submissions and prepare the data
-def fetch_submissions(user_id):
+def fetch_submissions(user_id, page_size=SUBMISSION_PAGE_SIZE, start_after=None, offset=0):
+    """Fetch one page of a user's submissions, newest first, formatted for display.
+
+    Only the preview fields are read; fetch_submission_detail loads the full
+    text and feedback of the submission that is opened. Returns the table rows,
+    their submission IDs and a cursor for the next page (None on the last page).
+    """
     organization = st.session_state['organization']
     admin_timezone_str = organization.get('timezone', 'UTC')
-    
-    """Fetch submission data and format for display."""
+
     user_ref = db.collection('users').document(user_id)
     submissions_ref = user_ref.collection('submissions').order_by(
-        'submit_time', direction=firestore.Query.DESCENDING)
-    submissions = list(submissions_ref.stream())
+        'submit_time', direction=firestore.Query.DESCENDING).select(SUBMISSION_LIST_FIELDS)
+    if start_after is not None:
+        submissions_ref = submissions_ref.start_after(start_after)
+
+    # Read one extra document to know whether another page exists
+    with span('firestore.fetch_submissions.stream') as fields:
+        submissions = list(submissions_ref.limit(page_size + 1).stream())
+        fields['reads'] = query_reads(len(submissions))
+    has_more = len(submissions) > page_size
+    submissions = submissions[:page_size]
 
     submission_data = []
-    submission_details = []
+    submission_ids = []
 
-    for idx, submission in enumerate(submissions):
-        submission_dict = submission.to_dict()
-        submit_time = submission_dict.get('submit_time')
+    submission_dicts = [submission.to_dict() for submission in submissions]
 
-        if submit_time:
-            # Use the utility function to convert to the admin's timezone
-            submit_time = convert_to_timezone(submit_time, admin_timezone_str)
-            submit_time_str = submit_time.strftime('%Y-%m-%d %H:%M')
-        else:
-            submit_time_str = '不明'
+    # Convert the page's submit times to the admin's timezone in one pass
+    submit_times = convert_series_to_timezone([d.get('submit_time') for d in submission_dicts], admin_timezone_str)
+    submit_time_strs = submit_times.dt.strftime('%Y-%m-%d %H:%M').fillna('不明')
+
+    for idx, (submission, submission_dict, submit_time_str) in enumerate(
+            zip(submissions, submission_dicts, submit_time_strs), start=offset):
+
+        # Submissions saved before previews existed show no preview
+        text_preview = submission_dict.get('text_preview', 'プレビューなし')
+        feedback_preview = submission_dict.get('feedback_preview', 'プレビューなし')
+        if submission_dict.get('text_length', 0) > len(text_preview):
+            text_preview += "..."
+        if submission_dict.get('feedback_length', 0) > len(feedback_preview):
+            feedback_preview += "..."
 
         # Prepare data for the table
         submission_data.append({
             "提出番号": idx + 1,
             "提出日時": submit_time_str,
-            "志望動機書": submission_dict.get('text', ''),
-            "フィードバックプレビュー": submission_dict.get('feedback', '')[:300] + "..."  # Preview first 30 characters of feedback
+            "志望動機書": text_preview,
+            "フィードバックプレビュー": feedback_preview  # Preview first 300 characters of feedback
         })
+        submission_ids.append(submission.id)
 
-        # Store detailed submission data
-        submission_details.append({
-            "text": submission_dict.get('text', ''),
-            "feedback": submission_dict.get('feedback', '添削なし')
-        })
+    cursor = submissions[-1] if has_more else None
+    return submission_data, submission_ids, cursor
 
-    return submission_data, submission_details
+# Function to fetch the full text and feedback of one submission
+def fetch_submission_detail(user_id, submission_id):
+    """Load the full text and feedback of a single submission."""
+    with span('firestore.fetch_submission_detail.get', reads=1):
+        submission_doc = db.collection('users').document(user_id).collection('submissions').document(submission_id).get()
+    submission_dict = submission_doc.to_dict() if submission_doc.exists else {}
+    return submission_dict.get('text', ''), submission_dict.get('feedback', '添削なし')
 
 
 # Function to display submission details
@@ -123,7 +118,8 @@ def display_submission_details(submission_text, feedback):
 
     with col1:
         st.subheader("志望動機書")
-        box_content = submission_text.replace('\n', '<br>')
+        # Escaped: the essay is student input, rendered as HTML
+        box_content = html.escape(submission_text).replace('\n', '<br>')
         st.markdown(f"""
             <div style="border: 1px solid #ccc; padding: 10px; border-radius: 5px; background-color: #f9f9f9;">
                 {box_content}
@@ -142,8 +138,21 @@ def display_submission_history(user_id):
     st.subheader(f"{user_id}の提出履歴")
 
     try:
-        # Fetch user details
-        university, faculty, department = fetch_user_details(user_id)
+        # Loaded pages are kept in the session until another user is selected
+        history = st.session_state.get('submission_history')
+        if history is None or history['user_id'] != user_id:
+            submission_data, submission_ids, cursor = fetch_submissions(user_id)
+            history = {
+                'user_id': user_id,
+                'user_details': fetch_user_details(user_id),
+                'rows': submission_data,
+                'ids': submission_ids,
+                'cursor': cursor,
+                'details': {},  # submission ID -> (text, feedback)
+            }
+            st.session_state.submission_history = history
+
+        university, faculty, department = history['user_details']
 
         # Display university, faculty, and department
         st.markdown(f"**大学:** {university}")
@@ -151,8 +160,8 @@ def display_submission_history(user_id):
         if department:
             st.markdown(f"**学科:** {department}")
 
-        # Fetch submission data
-        submission_data, submission_details = fetch_submissions(user_id)
+        submission_data = history['rows']
+        submission_ids = history['ids']
 
         if submission_data:
             # Display the interactive table
@@ -164,6 +173,16 @@ def display_submission_history(user_id):
                 key="submission_data_editor"
             )
 
+            # Load the next page after the last loaded submission
+            if history['cursor'] is not None and st.button("さらに読み込む", key="load_more_submissions"):
+                more_data, more_ids, cursor = fetch_submissions(
+                    user_id, start_after=history['cursor'], offset=len(submission_data)
+                )
+                history['rows'] = submission_data + more_data
+                history['ids'] = submission_ids + more_ids
+                history['cursor'] = cursor
+                st.rerun()
+
             # Create submission options for the selectbox
             submission_options = [f"提出 {item['提出番号']}" for item in submission_data]
 
@@ -173,9 +192,11 @@ def display_submission_history(user_id):
             # Get the index of the selected submission
             idx = submission_options.index(selected_submission)
 
-            # Retrieve the submission details
-            submission_text = submission_details[idx]['text']
-            feedback = submission_details[idx]['feedback']
+            # Retrieve the full text and feedback of the selected submission only
+            submission_id = submission_ids[idx]
+            if submission_id not in history['details']:
+                history['details'][submission_id] = fetch_submission_detail(user_id, submission_id)
+            submission_text, feedback = history['details'][submission_id]
 
             # Display the submission text and feedback using styled boxes
             display_submission_details(submission_text, feedback)
@@ -237,6 +258,71 @@ def display_submissions_tab(user_data):
     else:
         st.info("提出データがありません。")
 
+def display_bulk_evaluation_tab():
+    """Display bulk evaluation tab content"""
+    st.subheader("📦 一括採点")
+    st.write("`user_id` と `text` 列を含むCSV、または同じキーを持つJSONLファイルをアップロードしてください。")
+
+    uploaded_file = st.file_uploader("提出ファイル", type=["csv", "jsonl"], key="bulk_evaluation_file")
+    concurrency = st.number_input("同時採点数", min_value=1, max_value=MAX_CONCURRENCY, value=DEFAULT_CONCURRENCY)
+
+    if uploaded_file is not None and st.button("一括採点を開始", key="bulk_evaluation_start"):
+        rows = load_rows(uploaded_file)
+        if not rows:
+            st.warning("採点できる行が見つかりませんでした。")
+            return
+
+        progress_bar = st.progress(0, text="採点中...")
+
+        def show_progress(done, total, elapsed):
+            rate = done / elapsed if elapsed else 0.0
+            progress_bar.progress(done / total, text=f"採点中... {done}/{total}（{rate:.2f} 件/秒）")
+
+        organization = st.session_state['organization']
+        summary = evaluate_batch(rows, organization['org_code'], int(concurrency), on_progress=show_progress)
+        progress_bar.empty()
+
+        st.success(
+            f"{summary['succeeded']}件を保存しました（キャッシュ利用 {summary['cached']}件）。"
+            f"所要時間 {summary['elapsed']:.1f}秒（{summary['throughput']:.2f} 件/秒）"
+        )
+        if summary['errors']:
+            st.error(f"{summary['failed']}件の採点に失敗しました。")
+            st.dataframe(pd.DataFrame(summary['errors']), use_container_width=True, hide_index=True)
+
+def load_full_dashboard_data():
+    """Read everything the full dashboard shows for the logged-in organization."""
+    organization = st.session_state['organization']
+    admin_timezone = organization.get('timezone', 'UTC')
+
+    # Scan the organization's submissions once for both the user table and the charts
+    org_submissions = fetch_org_submissions(organization['org_code'])
+
+    # Fetch user data with the admin's timezone
+    user_data, registrations_this_month, active_users = get_user_data(org_submissions)
+
+    # Build submission data with the admin's timezone
+    submissions_df = fetch_submission_data(org_submissions)
+
+    # Calculate today's metrics based on the admin's timezone from the in-memory store,
+    # which holds every submit_time already; no count() aggregation is needed for them
+    today = datetime.now(pytz.timezone(admin_timezone)).date()
+    if not submissions_df.empty and 'date' in submissions_df.columns:
+        todays_rows = submissions_df[submissions_df['date'] == today]
+        todays_submissions = len(todays_rows)
+        todays_users = todays_rows['user_id'].nunique()
+    else:
+        todays_submissions = todays_users = 0
+
+    return {
+        'user_data': user_data,
+        'registrations_this_month': registrations_this_month,
+        'active_users': active_users,
+        'submissions_df': submissions_df,
+        'todays_submissions': todays_submissions,
+        'todays_users': todays_users,
+    }
+
 def full_org_dashboard():
     """Main dashboard function with tabbed interface"""
     # Apply custom styling
@@ -244,7 +330,6 @@ def full_org_dashboard():
 
     # Directly access organization data from session state
     organization = st.session_state['organization']
-    admin_timezone = organization.get('timezone', 'UTC')
     
     # Display organization header
     display_org_header()
@@ -252,25 +337,22 @@ def full_org_dashboard():
     
     # Fetch all necessary data
     try:
-        # Fetch user data with the admin's timezone
-        user_data, registrations_this_month, active_users = get_user_data()
-
-        # Fetch submission data with the admin's timezone
-        submissions_df = fetch_submission_data()
-        
-        # Calculate today's metrics based on the admin's timezone
-        today = datetime.now(pytz.timezone(admin_timezone)).date()
-        if not submissions_df.empty and 'date' in submissions_df.columns:
-            todays_submissions = len(submissions_df[submissions_df['date'] == today])
-            todays_users = submissions_df[submissions_df['date'] == today]['user_id'].nunique()
-        else:
-            todays_submissions = todays_users = 0
+        # Widget interactions are served from the per-organization cache
+        data = get_dashboard_data(organization['org_code'], 'full', load_full_dashboard_data)
+        user_data = data['user_data']
+        registrations_this_month = data['registrations_this_month']
+        active_users = data['active_users']
+        submissions_df = data['submissions_df']
+        todays_submissions = data['todays_submissions']
+        todays_users = data['todays_users']
+
+        display_cache_status(organization['org_code'], 'full')
         
         # Display original metrics
         display_full_metrics(registrations_this_month, active_users, todays_submissions, todays_users)
         
-        # Create two tabs
-        tab1, tab2 = st.tabs(["👥 ユーザー", "📝 提出履歴"])
+        # Create tabs
+        tab1, tab2, tab3 = st.tabs(["👥 ユーザー", "📝 提出履歴", "📦 一括採点"])
         
         # Display tab contents
         with tab1:
@@ -278,9 +360,12 @@ def full_org_dashboard():
         
         with tab2:
             display_submissions_tab(user_data)
+
+        with tab3:
+            display_bulk_evaluation_tab()
             
     except Exception as e:
-        st.error(f"ダッシュボードの読み込み中にエラーが発生しました: {str(e)}")
+        display_load_error(e)
         if st.button("再読み込み"):
             st.rerun()
 
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+import pytz
+from setup.firebase_setup import db
+from modules.telemetry import span
+from modules.firestore_usage import count_reads
+
+# Dashboard counts computed with Firestore count() aggregation queries. Each
+# call is billed as one read per 1,000 matching index entries and transfers
+# no documents.
+
+
+def _count(query, site):
+    with span(site) as fields:
+        result = query.count(alias='count').get()
+        count = int(result[0][0].value)
+        fields['reads'] = count_reads(count)
+    return count
+
+
+def _in_range(query, field, start=None, end=None):
+    if start is not None:
+        query = query.where(field, '>=', start)
+    if end is not None:
+        query = query.where(field, '<', end)
+    return query
+
+
+def _timezone(timezone_str):
+    try:
+        return pytz.timezone(timezone_str)
+    except pytz.UnknownTimeZoneError:
+        return pytz.utc
+
+
+def local_day_bounds(timezone_str, now=None):
+    """UTC start and end of the current day in `timezone_str`."""
+    tz = _timezone(timezone_str)
+    local_now = (now or datetime.now(pytz.utc)).astimezone(tz)
+    day = datetime(local_now.year, local_now.month, local_now.day)
+    return tz.localize(day).astimezone(pytz.utc), tz.localize(day + timedelta(days=1)).astimezone(pytz.utc)
+
+
+def local_month_bounds(timezone_str, now=None):
+    """UTC start and end of the current month in `timezone_str`."""
+    tz = _timezone(timezone_str)
+    local_now = (now or datetime.now(pytz.utc)).astimezone(tz)
+    month_start = datetime(local_now.year, local_now.month, 1)
+    next_month = datetime(local_now.year + local_now.month // 12, local_now.month % 12 + 1, 1)
+    return tz.localize(month_start).astimezone(pytz.utc), tz.localize(next_month).astimezone(pytz.utc)
+
+
+def count_user_submissions(user_id, start=None, end=None):
+    """Number of a user's submissions with `start <= submit_time < end`."""
+    query = db.collection('users').document(user_id).collection('submissions')
+    return _count(_in_range(query, 'submit_time', start, end), 'firestore.count_user_submissions')
+
+
+def count_org_registrations(org_code, start=None, end=None):
+    """Number of users in an organization with `start <= registerAt < end`."""
+    query = db.collection('users').where('org_code', '==', org_code)
+    return _count(_in_range(query, 'registerAt', start, end), 'firestore.count_org_registrations')
@@ -1,5 +1,6 @@
 import streamlit as st
-from .dashboard_common import apply_custom_css, display_org_header, get_user_data, display_active_users_table
+from .dashboard_common import apply_custom_css, display_org_header, get_user_data, display_active_users_table, display_cache_status
+from modules.dashboard_cache import get_dashboard_data
 from auth.login_manager import logout_org
 from setup.firebase_setup import db
 from auth.login_manager import logout_org
@@ -28,8 +29,10 @@ def show_org_dashboard():
     display_org_header()
     
 
-    # Fetch user data and update statuses
-    user_data, registrations_this_month, active_users = get_user_data()
+    # Fetch user data and update statuses; widget interactions are served from the cache
+    org_code = st.session_state.organization['org_code']
+    user_data, registrations_this_month, active_users = get_dashboard_data(org_code, 'basic', get_user_data)
+    display_cache_status(org_code, 'basic')
 
 
     # Display metrics
@@ -0,0 +1,116 @@
+import hmac
+import json
+import streamlit as st
+import pandas as pd
+from modules.modules import get_secret
+from modules.telemetry import histogram
+from auth.password_pool import password_pool
+from modules.feedback_cache import feedback_cache_stats, LOCAL_CACHE_SIZE
+from modules.warmup import is_ready, warmup_report
+from modules.firestore_usage import ledger, RERUN_READ_BUDGET, SESSION_READ_BUDGET, ORG_DAILY_READ_BUDGET
+
+
+def telemetry_admin_page():
+    """Latency percentiles and Firestore usage of this process, by page and call site.
+
+    Opened with `?admin=telemetry`; requires the `admin_token` app secret.
+    """
+    st.title("パフォーマンス計測")
+
+    admin_token = get_secret().get('admin_token')
+    if not admin_token:
+        st.error("管理ページは無効です。")
+        return
+
+    if not st.session_state.get('telemetry_admin'):
+        token = st.text_input("管理トークン", type="password")
+        if st.button("表示"):
+            if hmac.compare_digest(token.encode(), admin_token.encode()):
+                st.session_state.telemetry_admin = True
+                st.rerun()
+            else:
+                st.error("トークンが正しくありません。")
+        return
+
+    latency_tab, usage_tab = st.tabs(["⏱ レイテンシ", "📄 Firestore使用量"])
+    with latency_tab:
+        display_latency()
+    with usage_tab:
+        display_firestore_usage()
+
+
+def display_latency():
+    st.subheader("ウォームアップ")
+    stages = warmup_report()
+    if is_ready():
+        st.success("ウォームアップ完了")
+    elif stages:
+        st.info("ウォームアップ中です。")
+    else:
+        st.caption("このプロセスではウォームアップは実行されていません（serve.py から起動すると実行されます）。")
+    if stages:
+        st.dataframe(pd.DataFrame(stages), use_container_width=True, hide_index=True)
+
+    pool = password_pool.stats()
+    st.subheader("パスワード処理プール")
+    cols = st.columns(4)
+    cols[0].metric("処理中・待機中", f"{pool['in_flight']} / {pool['queue_limit']}")
+    cols[1].metric("最大同時数", pool['max_in_flight'])
+    cols[2].metric("拒否", pool['rejected'])
+    cols[3].metric("平均 (ms)", pool['mean_ms'] if pool['mean_ms'] is not None else "-")
+    st.caption(f"ワーカープロセス {pool['workers']} 個、完了 {pool['completed']} 件")
+
+    feedback = feedback_cache_stats()
+    st.subheader("添削結果キャッシュ")
+    cols = st.columns(4)
+    cols[0].metric("ヒット率", f"{feedback['hit_rate']:.0%}")
+    cols[1].metric("プロセス内ヒット", feedback['local_hits'])
+    cols[2].metric("Firestore ヒット", feedback['firestore_hits'])
+    cols[3].metric("ミス", feedback['misses'])
+    st.caption(f"プロセス内キャッシュ {feedback['local_size']} / {LOCAL_CACHE_SIZE} 件")
+
+    st.subheader("外部呼び出し")
+    rows = histogram.summary()
+    if not rows:
+        st.info("まだ計測データがありません。")
+        return
+
+    df = pd.DataFrame(rows)
+    pages = sorted(df['page'].unique())
+    selected_pages = st.multiselect("ページ", pages, default=pages)
+    df = df[df['page'].isin(selected_pages)].sort_values('p95_ms', ascending=False)
+
+    st.caption("このプロセスで記録された直近の呼び出し（呼び出し箇所ごとに最大1000件）")
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+    if st.button("リセット", key="reset_latency"):
+        histogram.reset()
+        st.rerun()
+
+
+def display_firestore_usage():
+    """Document reads and writes by page and organization, call site and session, with exports."""
+    usage = ledger.export()
+    if not any(usage.values()):
+        st.info("まだ計測データがありません。")
+        return
+
+    st.caption(
+        f"ソフト上限: 再実行あたり {RERUN_READ_BUDGET} 読み取り / セッションあたり {SESSION_READ_BUDGET} / "
+        f"教育機関あたり1日 {ORG_DAILY_READ_BUDGET}（超過時は警告ログ）"
+    )
+    for key, title in [('pages', "ページ・教育機関別"), ('sites', "呼び出し箇所別"), ('sessions', "セッション別")]:
+        st.subheader(title)
+        df = pd.DataFrame(usage[key])
+        if df.empty:
+            st.write("データなし")
+            continue
+        st.dataframe(df.sort_values('reads', ascending=False), use_container_width=True, hide_index=True)
+        st.download_button("CSVでダウンロード", df.to_csv(index=False).encode('utf-8-sig'),
+                           file_name=f"firestore_usage_{key}.csv", mime="text/csv", key=f"download_{key}")
+
+    st.download_button("すべてJSONでダウンロード", json.dumps(usage, ensure_ascii=False, indent=2),
+                       file_name="firestore_usage.json", mime="application/json")
+    if st.button("リセット", key="reset_usage"):
+        ledger.reset()
+        st.rerun()
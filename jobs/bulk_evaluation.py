@@ -0,0 +1,171 @@
+"""Bulk essay evaluation for organizations.
+
+Usage:
+    python -m jobs.bulk_evaluation drafts.csv --org ORG_CODE --concurrency 4
+
+The input is a CSV with `user_id` and `text` columns, or JSONL with the same keys.
+"""
+import argparse
+import csv
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from setup.firebase_setup import db
+from modules.modules import complete_assistant, get_secret
+from modules.submissions import build_evaluation_prompt, build_submission, submission_counter_update
+from modules.dashboard_cache import invalidate_dashboard
+from modules.feedback_cache import feedback_cache_key, lookup_feedback, store_feedback
+from modules.telemetry import span
+
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+
+# Saved essays are committed every COMMIT_WRITES writes (two per essay) or
+# COMMIT_INTERVAL seconds, so an interrupted run loses little finished work.
+# Firestore accepts at most 500 writes per batch.
+COMMIT_WRITES = 50
+COMMIT_INTERVAL = 10
+
+
+def load_rows(source, filename=None):
+    """Parse (user_id, text) rows from a CSV or JSONL file path or binary file object."""
+    filename = filename or getattr(source, 'name', '') or str(source)
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            raw = f.read()
+    else:
+        raw = source.read()
+    content = raw.decode('utf-8-sig') if isinstance(raw, bytes) else raw
+
+    if filename.lower().endswith(('.jsonl', '.ndjson')):
+        records = [json.loads(line) for line in content.splitlines() if line.strip()]
+    else:
+        records = list(csv.DictReader(io.StringIO(content)))
+
+    rows = []
+    for record in records:
+        user_id = str(record.get('user_id') or '').strip()
+        text = record.get('text') or ''
+        if user_id and text.strip():
+            rows.append({'user_id': user_id, 'text': text})
+    return rows
+
+
+def _evaluate_row(assistant_id, user_data, text):
+    """Return (feedback, from_cache) for one essay."""
+    uni_name = user_data.get('university', '')
+    faculty_name = user_data.get('faculty', '')
+    department_name = user_data.get('department', '')
+
+    feedback_key = feedback_cache_key(assistant_id, uni_name, faculty_name, department_name, text)
+    feedback = lookup_feedback(feedback_key)
+    if feedback:
+        return feedback, True
+
+    prompt = build_evaluation_prompt(uni_name, faculty_name, department_name, text)
+    feedback = complete_assistant(assistant_id, prompt)
+    store_feedback(feedback_key, feedback, assistant_id)
+    return feedback, False
+
+
+def evaluate_batch(rows, org_code, concurrency=DEFAULT_CONCURRENCY, on_progress=None):
+    """Evaluate `rows` with at most `concurrency` runs in flight and save them as submissions.
+
+    Rows whose user does not belong to `org_code` are rejected. `on_progress`
+    is called from the calling thread as `on_progress(done, total, elapsed)`.
+    Returns a summary dict with counts, elapsed seconds, throughput and errors.
+    """
+    started = time.monotonic()
+    concurrency = max(1, min(concurrency, MAX_CONCURRENCY))
+    assistant_id = get_secret()['Unicke_id']
+    summary = {'total': len(rows), 'succeeded': 0, 'cached': 0, 'failed': 0, 'errors': []}
+
+    # One batched read for every user in the file
+    user_ids = sorted({row['user_id'] for row in rows})
+    user_refs = [db.collection('users').document(user_id) for user_id in user_ids]
+    with span('firestore.evaluate_batch.get_users', reads=len(user_refs)):
+        users = {doc.id: doc.to_dict() for doc in db.get_all(user_refs) if doc.exists}
+
+    pending = []
+    for row in rows:
+        user_data = users.get(row['user_id'])
+        if user_data is None or user_data.get('org_code') != org_code:
+            summary['failed'] += 1
+            summary['errors'].append({'user_id': row['user_id'], 'error': 'この教育機関のユーザーではありません'})
+        else:
+            pending.append((row, user_data))
+
+    batch = db.batch()
+    batch_size = 0
+    last_commit = time.monotonic()
+    done = summary['failed']
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = {
+        executor.submit(_evaluate_row, assistant_id, user_data, row['text']): (row, user_data)
+        for row, user_data in pending
+    }
+    try:
+        for future in as_completed(futures):
+            row, user_data = futures[future]
+            try:
+                feedback, from_cache = future.result()
+                user_ref = db.collection('users').document(row['user_id'])
+                submission = build_submission(
+                    user_data, row['text'], user_data.get('university', ''), user_data.get('faculty', ''),
+                    user_data.get('department', ''), feedback
+                )
+                batch.set(user_ref.collection('submissions').document(), submission)
+                batch.update(user_ref, submission_counter_update(user_ref, user_data, submission['submit_time']))
+                batch_size += 2
+                summary['succeeded'] += 1
+                summary['cached'] += int(from_cache)
+            except Exception as e:
+                print(f"Error evaluating essay for {row['user_id']}: {e}")
+                summary['failed'] += 1
+                summary['errors'].append({'user_id': row['user_id'], 'error': str(e)})
+
+            if batch_size >= COMMIT_WRITES or (batch_size and time.monotonic() - last_commit >= COMMIT_INTERVAL):
+                with span('firestore.evaluate_batch.commit', writes=batch_size):
+                    batch.commit()
+                batch = db.batch()
+                batch_size = 0
+                last_commit = time.monotonic()
+
+            done += 1
+            if on_progress:
+                on_progress(done, summary['total'], time.monotonic() - started)
+    finally:
+        # Also reached when the run is interrupted (an error, Ctrl-C or a Streamlit
+        # rerun): essays not started yet are dropped and every finished one is saved
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if batch_size:
+            with span('firestore.evaluate_batch.commit', writes=batch_size):
+                batch.commit()
+        invalidate_dashboard(org_code)
+
+    summary['elapsed'] = time.monotonic() - started
+    summary['throughput'] = summary['succeeded'] / summary['elapsed'] if summary['elapsed'] else 0.0
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a class's essays in bulk.")
+    parser.add_argument("path", help="CSV or JSONL file with user_id and text")
+    parser.add_argument("--org", required=True, help="Organization code the users belong to")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of evaluations running at once")
+    args = parser.parse_args()
+
+    def print_progress(done, total, elapsed):
+        rate = done / elapsed if elapsed else 0.0
+        print(f"{done}/{total} evaluated ({rate:.2f} essays/s)")
+
+    result = evaluate_batch(load_rows(args.path), args.org, args.concurrency, on_progress=print_progress)
+    print(f"Done: {result['succeeded']} saved ({result['cached']} from cache), {result['failed']} failed "
+          f"in {result['elapsed']:.1f}s ({result['throughput']:.2f} essays/s)")
+    for error in result['errors']:
+        print(f"  {error['user_id']}: {error['error']}")
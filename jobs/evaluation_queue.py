@@ -0,0 +1,47 @@
+from datetime import datetime
+import pytz
+from setup.firebase_setup import db
+from modules.telemetry import span
+
+# Firestore collection holding one document per queued evaluation
+JOBS_COLLECTION = 'evaluation_jobs'
+
+# Job lifecycle: queued -> running -> done | failed (running jobs are re-queued on retry)
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def enqueue_evaluation(assistant_id, prompt, user_id, txt, uni_name, faculty_name, department_name, feedback_key=None):
+    """Queue an essay for evaluation by the worker process and return the job ID.
+
+    `prompt` is what the assistant sees; the remaining fields are what
+    write_submission stores once the feedback is ready. The feedback is
+    stored in the feedback cache under `feedback_key` when given.
+    """
+    with span('firestore.enqueue_evaluation.add', writes=1):
+        _, job_ref = db.collection(JOBS_COLLECTION).add({
+            'assistant_id': assistant_id,
+            'prompt': prompt,
+            'user_id': user_id,
+            'text': txt,
+            'university': uni_name,
+            'faculty': faculty_name,
+            'department': department_name if department_name else "",
+            'feedback_key': feedback_key,
+            'status': STATUS_QUEUED,
+            'attempts': 0,
+            'created_at': datetime.now(pytz.utc),
+            'feedback': None,
+            'error': None,
+            'submission_id': None,
+        })
+    return job_ref.id
+
+
+def get_job(job_id):
+    """Return the job document as a dict, or None if it does not exist."""
+    with span('firestore.get_job.get', reads=1):
+        job_doc = db.collection(JOBS_COLLECTION).document(job_id).get()
+    return job_doc.to_dict() if job_doc.exists else None
@@ -0,0 +1,136 @@
+"""Evaluation worker: runs queued essay evaluations outside the Streamlit server.
+
+Usage:
+    python -m jobs.evaluation_worker --concurrency 4
+"""
+import argparse
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytz
+from firebase_admin import firestore
+from setup.firebase_setup import db
+from modules.modules import complete_assistant, RUN_TIMEOUT
+from modules.submissions import write_submission
+from modules.feedback_cache import lookup_feedback, store_feedback
+from jobs.evaluation_queue import JOBS_COLLECTION, STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+
+DEFAULT_CONCURRENCY = 4
+POLL_INTERVAL = 2.0
+
+# A job whose worker disappeared is re-queued once its lease runs out
+LEASE_SECONDS = RUN_TIMEOUT + 60
+LEASE_CHECK_INTERVAL = 60
+MAX_ATTEMPTS = 3
+
+
+@firestore.transactional
+def _claim_job(transaction, job_ref, worker_id):
+    """Atomically move a queued job to running. Returns the job data, or None if another worker got it."""
+    snapshot = job_ref.get(transaction=transaction)
+    job = snapshot.to_dict() if snapshot.exists else None
+    if not job or job.get('status') != STATUS_QUEUED:
+        return None
+
+    now = datetime.now(pytz.utc)
+    transaction.update(job_ref, {
+        'status': STATUS_RUNNING,
+        'worker_id': worker_id,
+        'started_at': now,
+        'lease_expires_at': now + timedelta(seconds=LEASE_SECONDS),
+        'attempts': job.get('attempts', 0) + 1,
+    })
+    job['attempts'] = job.get('attempts', 0) + 1
+    return job
+
+
+def process_job(job_ref, job):
+    """Evaluate one job and write the result back as a submission."""
+    try:
+        feedback_key = job.get('feedback_key')
+        feedback = lookup_feedback(feedback_key) if feedback_key else None
+        if not feedback:
+            feedback = complete_assistant(job['assistant_id'], job['prompt'])
+            if feedback_key:
+                store_feedback(feedback_key, feedback, job['assistant_id'])
+        # Saved under the job ID, so a job retried after its submission was written
+        # (e.g. the worker died before marking it done) does not save it twice
+        submission_id = write_submission(
+            job['user_id'], job['text'], job['university'], job['faculty'], job['department'], feedback,
+            submission_id=job_ref.id
+        )
+        job_ref.update({
+            'status': STATUS_DONE,
+            'feedback': feedback,
+            'submission_id': submission_id,
+            'finished_at': datetime.now(pytz.utc),
+            'error': None,
+        })
+    except Exception as e:
+        print(f"Error processing evaluation job {job_ref.id}: {e}")
+        retry = job['attempts'] < MAX_ATTEMPTS
+        job_ref.update({
+            'status': STATUS_QUEUED if retry else STATUS_FAILED,
+            'error': str(e),
+            'lease_expires_at': None,
+            'finished_at': None if retry else datetime.now(pytz.utc),
+        })
+
+
+def requeue_expired_jobs():
+    """Put running jobs whose lease expired back in the queue."""
+    now = datetime.now(pytz.utc)
+    running = db.collection(JOBS_COLLECTION).where('status', '==', STATUS_RUNNING).stream()
+    for job_doc in running:
+        job = job_doc.to_dict()
+        lease_expires_at = job.get('lease_expires_at')
+        if lease_expires_at and lease_expires_at < now:
+            expired = job.get('attempts', 0) >= MAX_ATTEMPTS
+            job_doc.reference.update({
+                'status': STATUS_FAILED if expired else STATUS_QUEUED,
+                'error': 'Worker lease expired',
+                'lease_expires_at': None,
+            })
+
+
+def run_worker(concurrency=DEFAULT_CONCURRENCY, poll_interval=POLL_INTERVAL):
+    """Claim queued jobs and evaluate at most `concurrency` of them at a time."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    print(f"Evaluation worker {worker_id} started with concurrency {concurrency}")
+
+    in_flight = set()
+    last_lease_check = 0.0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            in_flight = {future for future in in_flight if not future.done()}
+            free_slots = concurrency - len(in_flight)
+
+            if free_slots > 0:
+                # Oldest first, so a steady stream of new jobs cannot starve earlier ones
+                queued = (db.collection(JOBS_COLLECTION)
+                          .where('status', '==', STATUS_QUEUED)
+                          .order_by('created_at')
+                          .limit(free_slots)
+                          .stream())
+                for job_doc in queued:
+                    job = _claim_job(db.transaction(), job_doc.reference, worker_id)
+                    if job:
+                        in_flight.add(executor.submit(process_job, job_doc.reference, job))
+
+            if time.monotonic() - last_lease_check > LEASE_CHECK_INTERVAL:
+                requeue_expired_jobs()
+                last_lease_check = time.monotonic()
+
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued essay evaluations.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of evaluations running at once")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help="Seconds between checks for new jobs")
+    args = parser.parse_args()
+    run_worker(args.concurrency, args.poll_interval)
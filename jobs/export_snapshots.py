@@ -0,0 +1,90 @@
+"""Export organization submissions to Parquet snapshots, partitioned by month.
+
+Usage:
+    python -m jobs.export_snapshots [--org ORG_CODE] [--with-bodies] [--root PATH]
+
+Each run appends only the submissions saved since the organization's last
+export watermark. Submissions without --with-bodies keep their metadata and
+lengths but not the essay text and feedback. Run it daily (e.g. from cron or
+Cloud Scheduler) so the dashboards only need live queries for the current day.
+
+The snapshot root has to be storage the app also reads: on Cloud Run, a
+Cloud Storage bucket mounted in both the job and the service (see
+modules/snapshots.py). Snapshots written with --with-bodies contain student
+essays; keep them out of images and repositories.
+"""
+import argparse
+import os
+from datetime import datetime
+import pandas as pd
+from setup.firebase_setup import db
+from modules.org_aggregates import WATERMARK_OVERLAP
+from modules.snapshots import (
+    SNAPSHOT_ROOT, SNAPSHOT_COLUMNS, BODY_COLUMNS, snapshot_dir, read_watermark, write_watermark, load_snapshot
+)
+
+
+def _submission_row(submission, with_bodies):
+    sub_data = submission.to_dict()
+    row = {
+        'path': submission.reference.path,
+        'user_id': submission.reference.parent.parent.id,
+        **{field: sub_data.get(field) for field in SNAPSHOT_COLUMNS if field not in ('path', 'user_id')},
+    }
+    if with_bodies:
+        row.update({field: sub_data.get(field) for field in BODY_COLUMNS})
+    return row
+
+
+def export_org(org_code, with_bodies=False, root=None):
+    """Append an organization's new submissions to its snapshot. Returns the number of rows written."""
+    root = root or SNAPSHOT_ROOT
+    watermark = read_watermark(org_code, root)
+
+    fields = SNAPSHOT_COLUMNS[2:] + (BODY_COLUMNS if with_bodies else [])
+    query = db.collection_group('submissions').where('org_code', '==', org_code).select(fields)
+    exported_paths = set()
+    if watermark is not None:
+        # Re-read a short overlap for submissions committed out of submit_time order
+        since = watermark - WATERMARK_OVERLAP
+        query = query.where('submit_time', '>=', since)
+        exported_paths = set(load_snapshot(org_code, columns=['submit_time'], since=since, root=root)['path'])
+
+    rows = [
+        _submission_row(submission, with_bodies) for submission in query.stream()
+        if submission.reference.path not in exported_paths
+    ]
+    rows = [row for row in rows if row['submit_time']]
+    if not rows:
+        return 0
+
+    df = pd.DataFrame(rows)
+    df['submit_time'] = pd.to_datetime(df['submit_time'], utc=True)
+    for col in ('text_length', 'feedback_length'):
+        df[col] = df[col].fillna(0).astype('int64')
+
+    # One new file per month partition, so earlier exports are never rewritten
+    part_name = f"part-{datetime.now().strftime('%Y%m%dT%H%M%S')}.parquet"
+    for month, month_df in df.groupby(df['submit_time'].dt.strftime('%Y-%m')):
+        month_dir = os.path.join(snapshot_dir(org_code, root), f"month={month}")
+        os.makedirs(month_dir, exist_ok=True)
+        month_df.to_parquet(os.path.join(month_dir, part_name), index=False)
+
+    new_watermark = df['submit_time'].max().to_pydatetime()
+    if watermark is not None and watermark > new_watermark:
+        new_watermark = watermark
+    write_watermark(org_code, new_watermark, len(df), with_bodies, root)
+    return len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export organization submissions to Parquet snapshots.")
+    parser.add_argument("--org", help="Only export this organization")
+    parser.add_argument("--with-bodies", action="store_true", help="Include essay text and feedback")
+    parser.add_argument("--root", default=SNAPSHOT_ROOT, help="Snapshot directory (default: %(default)s)")
+    args = parser.parse_args()
+
+    org_codes = [args.org] if args.org else [org.id for org in db.collection('organizations').stream()]
+    for org_code in org_codes:
+        count = export_org(org_code, args.with_bodies, args.root)
+        print(f"{org_code}: {count} submissions exported")
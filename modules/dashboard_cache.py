@@ -0,0 +1,34 @@
+import os
+from modules.cache import TTLCache
+
+# Seconds organization dashboard data is served from memory before it is re-read
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 300))
+
+# Dashboard variants cached separately per organization
+DASHBOARD_KINDS = ('basic', 'full')
+
+_dashboard_cache = TTLCache(ttl=DASHBOARD_CACHE_TTL, max_size=200)
+
+
+def get_dashboard_data(org_code, kind, loader):
+    """Return the cached dashboard data of an organization, calling `loader()` on a miss.
+
+    The returned data is shared by every admin session of the organization
+    and must not be modified.
+    """
+    return _dashboard_cache.get_or_load((org_code, kind), loader)
+
+
+def dashboard_cache_age(org_code, kind):
+    """Seconds since the organization's dashboard data was loaded, or None."""
+    return _dashboard_cache.age((org_code, kind))
+
+
+def invalidate_dashboard(org_code):
+    """Drop the cached dashboard data of an organization, e.g. after a new submission."""
+    for kind in DASHBOARD_KINDS:
+        _dashboard_cache.invalidate((org_code, kind))
+
+
+def dashboard_cache_stats():
+    return _dashboard_cache.stats()
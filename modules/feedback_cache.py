@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+import pytz
+from setup.firebase_setup import db
+from modules.telemetry import span
+from modules.cache import TTLCache
+from modules.modules import get_assistant, AssistantRunError
+
+# Firestore collection holding one document per distinct evaluation input
+FEEDBACK_CACHE_COLLECTION = 'feedback_cache'
+
+# In-process LRU in front of Firestore
+LOCAL_CACHE_SIZE = 512
+LOCAL_CACHE_TTL = 6 * 3600
+# Firestore entries live as long as local ones; past `expires_at` they are
+# ignored here and deleted by the TTL policy in setup/firestore.indexes.json
+FEEDBACK_CACHE_TTL = LOCAL_CACHE_TTL
+
+_local_cache = TTLCache(ttl=LOCAL_CACHE_TTL, max_size=LOCAL_CACHE_SIZE)
+_stats_lock = threading.Lock()
+_stats = {'local_hits': 0, 'firestore_hits': 0, 'misses': 0}
+
+
+def normalize_essay(txt):
+    """Normalize an essay so that whitespace-only and width-only edits map to the same key."""
+    txt = unicodedata.normalize('NFKC', txt or "")
+    return re.sub(r'\s+', ' ', txt).strip()
+
+
+def get_assistant_version(assistant_id):
+    """Fingerprint of the assistant's model and instructions, so edited assistants miss the cache."""
+    assistant = get_assistant(assistant_id)
+    fingerprint = f"{assistant.model}\n{assistant.instructions or ''}"
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+
+def feedback_cache_key(assistant_id, uni_name, faculty_name, department_name, txt):
+    """Content hash identifying an evaluation input.
+
+    None when the assistant cannot be retrieved; lookup_feedback and
+    store_feedback skip the cache for a None key, so grading goes on without it.
+    """
+    try:
+        version = get_assistant_version(assistant_id)
+    except AssistantRunError as e:
+        print(f"Error fingerprinting assistant {assistant_id}, skipping the feedback cache: {e}")
+        return None
+    parts = [
+        assistant_id,
+        version,
+        uni_name or "",
+        faculty_name or "",
+        department_name or "",
+        normalize_essay(txt),
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def lookup_feedback(key):
+    """Return cached feedback for `key`, or None."""
+    if key is None:
+        return None
+    feedback = _local_cache.get(key)
+    if feedback is not None:
+        _count('local_hits')
+        return feedback
+
+    try:
+        with span('firestore.lookup_feedback.get', reads=1):
+            cache_doc = db.collection(FEEDBACK_CACHE_COLLECTION).document(key).get()
+    except Exception as e:
+        print(f"Error reading feedback cache: {e}")
+        cache_doc = None
+
+    if cache_doc is not None and cache_doc.exists:
+        cache_data = cache_doc.to_dict()
+        feedback = cache_data.get('feedback')
+        # Entries written before expires_at existed are treated as expired
+        expires_at = cache_data.get('expires_at')
+        if feedback and expires_at and expires_at > datetime.now(pytz.utc):
+            _local_cache.set(key, feedback)
+            _count('firestore_hits')
+            return feedback
+
+    _count('misses')
+    return None
+
+
+def store_feedback(key, feedback, assistant_id):
+    """Remember the feedback produced for `key` locally and in Firestore."""
+    if key is None or not feedback:
+        return
+    _local_cache.set(key, feedback)
+    now = datetime.now(pytz.utc)
+    try:
+        with span('firestore.store_feedback.set', writes=1):
+            db.collection(FEEDBACK_CACHE_COLLECTION).document(key).set({
+                'feedback': feedback,
+                'assistant_id': assistant_id,
+                'created_at': now,
+                'expires_at': now + timedelta(seconds=FEEDBACK_CACHE_TTL),
+            })
+    except Exception as e:
+        print(f"Error writing feedback cache: {e}")
+
+
+def feedback_cache_stats():
+    """Hit and miss counts for this process, for sizing the cache."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['local_hits'] + stats['firestore_hits'] + stats['misses']
+    hits = stats['local_hits'] + stats['firestore_hits']
+    stats['hit_rate'] = hits / lookups if lookups else 0.0
+    stats['local_size'] = _local_cache.stats()['size']
+    return stats
@@ -0,0 +1,141 @@
+import json
+import math
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+import pytz
+
+# Soft budgets of Firestore document reads; exceeding one only logs a warning.
+# 0 disables a budget.
+RERUN_READ_BUDGET = int(os.environ.get('FIRESTORE_RERUN_READ_BUDGET', 2000))
+SESSION_READ_BUDGET = int(os.environ.get('FIRESTORE_SESSION_READ_BUDGET', 20000))
+ORG_DAILY_READ_BUDGET = int(os.environ.get('FIRESTORE_ORG_DAILY_READ_BUDGET', 200000))
+
+# Sessions remembered for per-session totals; the least recently active are dropped
+MAX_SESSIONS = 5000
+
+
+def query_reads(documents):
+    """Billed reads of a query that returned `documents` documents (an empty result costs one)."""
+    return max(documents, 1)
+
+
+def count_reads(count):
+    """Billed reads of a count() aggregation over `count` index entries."""
+    return max(math.ceil(count / 1000), 1)
+
+
+def _log_warning(message, **fields):
+    print(json.dumps({'severity': 'WARNING', 'message': message, 'event': 'firestore_budget', **fields},
+                     ensure_ascii=False, default=str), flush=True)
+
+
+def session_context():
+    """(session ID, org_code) of the Streamlit session running on this thread, or (None, None)."""
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None:
+            return None, None
+        user = st.session_state.get('user') or {}
+        organization = st.session_state.get('organization') or {}
+        return ctx.session_id, organization.get('org_code') or user.get('org_code')
+    except Exception:
+        return None, None
+
+
+class UsageLedger:
+    """Firestore reads and writes of this process by page and org, call site, and session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_page_org = defaultdict(lambda: {'reruns': 0, 'reads': 0, 'writes': 0})
+        self._by_site = defaultdict(lambda: {'calls': 0, 'reads': 0, 'writes': 0})
+        self._sessions = OrderedDict()  # session ID -> totals
+        self._org_days = {}  # org_code -> (UTC date, reads)
+        self._warned_orgs = set()  # (org_code, date) pairs already warned about
+
+    def record_call(self, page, site, reads, writes, in_rerun=True):
+        """Add one call's reads and writes. Calls outside a rerun (workers, imports) are
+        also added to the page totals directly, as they belong to no rerun."""
+        with self._lock:
+            totals = self._by_site[(page, site)]
+            totals['calls'] += 1
+            totals['reads'] += reads
+            totals['writes'] += writes
+            if not in_rerun:
+                totals = self._by_page_org[(page, None)]
+                totals['reads'] += reads
+                totals['writes'] += writes
+
+    def record_rerun(self, page, rerun_id, reads, writes, session_id=None, org_code=None):
+        """Add one rerun's totals and log a warning for every soft budget it exceeds."""
+        with self._lock:
+            totals = self._by_page_org[(page, org_code)]
+            totals['reruns'] += 1
+            totals['reads'] += reads
+            totals['writes'] += writes
+
+            session = None
+            if session_id is not None:
+                session = self._sessions.pop(session_id, None) or {
+                    'org_code': org_code, 'reruns': 0, 'reads': 0, 'writes': 0, 'warned': False}
+                session['org_code'] = org_code or session['org_code']
+                session['reruns'] += 1
+                session['reads'] += reads
+                session['writes'] += writes
+                self._sessions[session_id] = session
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+
+            org_reads = None
+            today = datetime.now(pytz.utc).strftime('%Y-%m-%d')
+            if org_code:
+                day, org_reads = self._org_days.get(org_code, (today, 0))
+                org_reads = (org_reads if day == today else 0) + reads
+                self._org_days[org_code] = (today, org_reads)
+
+            warn_session = bool(session and SESSION_READ_BUDGET and not session['warned']
+                                and session['reads'] > SESSION_READ_BUDGET)
+            if warn_session:
+                session['warned'] = True
+            warn_org = bool(org_reads is not None and ORG_DAILY_READ_BUDGET and org_reads > ORG_DAILY_READ_BUDGET
+                            and (org_code, today) not in self._warned_orgs)
+            if warn_org:
+                self._warned_orgs.add((org_code, today))
+
+        if RERUN_READ_BUDGET and reads > RERUN_READ_BUDGET:
+            _log_warning(f"Rerun of {page} read {reads} documents (budget {RERUN_READ_BUDGET})",
+                         budget='rerun', page=page, rerun_id=rerun_id, org_code=org_code, reads=reads)
+        if warn_session:
+            _log_warning(f"Session read {session['reads']} documents (budget {SESSION_READ_BUDGET})",
+                         budget='session', page=page, session_id=session_id, org_code=org_code,
+                         reads=session['reads'])
+        if warn_org:
+            _log_warning(f"Organization {org_code} read {org_reads} documents today (UTC, budget {ORG_DAILY_READ_BUDGET})",
+                         budget='org_daily', page=page, org_code=org_code, reads=org_reads)
+
+    def export(self):
+        """All totals as lists of rows, keyed 'pages', 'sites' and 'sessions'."""
+        with self._lock:
+            return {
+                'pages': [{'page': page, 'org_code': org_code, **totals}
+                          for (page, org_code), totals in self._by_page_org.items()],
+                'sites': [{'page': page, 'site': site, **totals}
+                          for (page, site), totals in self._by_site.items()],
+                'sessions': [{'session_id': session_id, **{k: v for k, v in totals.items() if k != 'warned'}}
+                             for session_id, totals in self._sessions.items()],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._by_page_org.clear()
+            self._by_site.clear()
+            self._sessions.clear()
+            self._org_days.clear()
+            self._warned_orgs.clear()
+
+
+ledger = UsageLedger()
@@ -1,6 +1,6 @@
 import streamlit as st
-from auth.login_manager import logout_user
-from setup.firebase_setup import db
+from auth.login_manager import logout_user, restore_user_session
+from modules.org_cache import get_org_config
 
 
 if 'user' not in st.session_state:
@@ -28,9 +28,8 @@ def add_footer():
 
 def get_org_name(org_code):
     try:
-        org_ref = db.collection('organizations').document(org_code).get()
-        if org_ref.exists:
-            org_data = org_ref.to_dict()
+        org_data = get_org_config(org_code)
+        if org_data is not None:
             return org_data.get('org_name', 'Organization not found')
         else:
             return 'Organization not found'
@@ -41,9 +40,8 @@ def get_org_name(org_code):
 def check_sartre_enabled(org_code):
     """Check if Sartre is enabled for the user's organization."""
     try:
-        org_ref = db.collection('organizations').document(org_code).get()
-        if org_ref.exists:
-            org_data = org_ref.to_dict()
+        org_data = get_org_config(org_code)
+        if org_data is not None:
             return org_data.get('sartre', False)  # Default to False if Sartre field doesn't exist
         else:
             st.error("Organization not found")
@@ -111,7 +109,7 @@ def menu():
     # Determine if a user is logged in or not, then show the correct
     # navigation menu
     add_footer()
-    
+    restore_user_session()
 
     if st.session_state.user:
         authenticated_menu()
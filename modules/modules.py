@@ -1,25 +1,87 @@
 import streamlit as st
-from openai import OpenAI
+import threading
 import time
-from PIL import Image
+import random
+import os
+import io
+import hashlib
+from contextlib import contextmanager
+from PIL import Image, ImageOps
 import base64
 import requests
-from google.cloud import secretmanager
-import json
 import pytz
 from datetime import datetime
+from setup.secret_cache import get_cached_secret
+from modules.cache import TTLCache
+from modules.telemetry import span
+
+APP_SECRET_NAME = "projects/581656499945/secrets/unicke_apis/versions/latest"
 
 def get_secret():
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/581656499945/secrets/unicke_apis/versions/latest"
-    response = client.access_secret_version(request={"name": name})
-    secret_string = response.payload.data.decode("UTF-8")
-    return json.loads(secret_string)
+    """Return the app secrets, served from the process-wide secret cache."""
+    with span('secret_manager.get_secret'):
+        return get_cached_secret(APP_SECRET_NAME)
+
+# Keep-alive pool shared by every session; sized for a class submitting at once
+OPENAI_MAX_CONNECTIONS = 50
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+OPENAI_KEEPALIVE_EXPIRY = 120
+OPENAI_TIMEOUT = 60.0
+OPENAI_CONNECT_TIMEOUT = 5.0
+
+# Assistant settings change rarely; re-read them every 30 minutes
+ASSISTANT_CACHE_TTL = 1800
+
+_client = None
+_client_lock = threading.Lock()
+_assistant_cache = TTLCache(ttl=ASSISTANT_CACHE_TTL)
+
+
+def get_openai_client():
+    """Return the process-wide OpenAI client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Imported here: the SDK takes most of a second to import and the login screen never needs it
+            import httpx
+            from openai import OpenAI, DefaultHttpxClient, Timeout
+
+            limits = httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                  max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                                  keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY)
+            # openai.Timeout matches the httpx flavour the client is built on
+            timeout = Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+            _client = OpenAI(
+                api_key=get_secret()['api_key'],
+                http_client=DefaultHttpxClient(limits=limits, timeout=timeout),
+            )
+        return _client
+
+
+def _retrieve_assistant(assistant_id):
+    with span('openai.get_assistant.retrieve'):
+        return get_openai_client().beta.assistants.retrieve(assistant_id)
+
+
+def get_assistant(assistant_id):
+    """Return assistant metadata, retrieved at most once per ASSISTANT_CACHE_TTL.
+
+    Raises AssistantRunError when the assistant cannot be retrieved.
+    """
+    with _assistant_api_errors():
+        return _assistant_cache.get_or_load(assistant_id, lambda: _retrieve_assistant(assistant_id))
+
+
+# Secret keys holding the IDs of the assistants used across the app
+ASSISTANT_SECRET_KEYS = ('Unicke_id', 'AI_uKnow', 'Friedrich_Sartre')
+
+def preload_assistants():
+    """Fill the assistant cache for every assistant the app uses."""
+    app_secrets = get_secret()
+    for key in ASSISTANT_SECRET_KEYS:
+        if app_secrets.get(key):
+            get_assistant(app_secrets[key])
 
-secrets = get_secret()
-api = secrets['api_key']
-# #Initialize OpenAI client and set default assistant_id
-client = OpenAI(api_key=api)
 
 def convert_to_timezone(utc_time: datetime, timezone_str: str):
     """Converts a UTC datetime to the specified timezone."""
@@ -34,57 +96,239 @@ def convert_to_timezone(utc_time: datetime, timezone_str: str):
         return utc_time  # Return the original UTC time in case of error
 
 
-def run_assistant(assistant_id, txt, return_content=False, display_chat=True, user_name="user", assistant_name="assistant"):
-    # Initialize OpenAI client and set assistant if not already initialized
-    st.session_state.client = OpenAI(api_key=api)
-    st.session_state.assistant = st.session_state.client.beta.assistants.retrieve(assistant_id)
-    st.session_state.thread = st.session_state.client.beta.threads.create()
+def convert_series_to_timezone(values, timezone_str: str):
+    """Vectorized convert_to_timezone for a sequence of UTC datetimes.
+
+    Returns a timezone-aware pandas Series in `timezone_str`, with NaT for
+    missing values. Inputs pandas cannot convert in bulk are converted one by
+    one with convert_to_timezone.
+    """
+    import pandas as pd  # Only the dashboards need pandas; keep it out of the login path
+
+    series = pd.Series(list(values), dtype=object)
+    converted = pd.to_datetime(series, utc=True, errors='coerce')
+
+    # Fallback for odd inputs that the bulk conversion could not handle
+    odd = converted.isna() & series.notna()
+    for idx in series[odd].index:
+        value = convert_to_timezone(series[idx], 'UTC')
+        if isinstance(value, datetime):
+            converted[idx] = pd.Timestamp(value)
+
+    try:
+        return converted.dt.tz_convert(timezone_str)
+    except Exception as e:
+        print(f"Error converting time: {e}")
+        return converted  # Keep UTC in case of error, like convert_to_timezone
+
+
+# Minimum seconds between re-renders of partially streamed text
+STREAM_RENDER_INTERVAL = 0.1
+
+# Polling starts fast for quick runs and backs off for slow ones
+POLL_INITIAL_INTERVAL = 0.25
+POLL_MAX_INTERVAL = 4.0
+POLL_BACKOFF = 1.6
+
+# Seconds a run may take before it is cancelled server-side
+RUN_TIMEOUT = 180
+
+# Statuses after which the run has stopped on OpenAI's side and needs no cancel
+RUN_FINISHED_STATUSES = ('completed', 'failed', 'expired', 'cancelled', 'incomplete')
+
+
+class AssistantRunError(Exception):
+    """Raised when an assistant run ends without a completed answer."""
+
+
+def _describe_run_failure(run):
+    if run is None:
+        return "Assistant run ended before it started"
+    if run.status == 'requires_action':
+        return "Assistant run requires tool outputs, which this app does not provide"
+    error = getattr(run, 'last_error', None)
+    detail = f": {error.code} - {error.message}" if error else ""
+    return f"Assistant run {run.status}{detail}"
+
+
+@contextmanager
+def _assistant_api_errors():
+    """Re-raise OpenAI API errors as AssistantRunError, the one error callers handle."""
+    from openai import APIError
+    try:
+        yield
+    except APIError as e:
+        raise AssistantRunError(f"OpenAI API error: {e}") from e
+
+
+def _cancel_run(client, thread_id, run_id):
+    try:
+        with span('openai.runs.cancel'):
+            client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        print(f"Error cancelling run {run_id}: {e}")
+
+
+def wait_for_run(client, thread_id, run_id, timeout=RUN_TIMEOUT, on_poll=None):
+    """Poll a run until it completes, backing off exponentially with jitter.
+
+    Raises AssistantRunError on a failed, expired, cancelled, incomplete or
+    requires_action run, or when `timeout` seconds pass. The run is cancelled
+    server-side whenever polling stops before it finished, including when the
+    Streamlit script is interrupted by a rerun or the user leaving the page.
+    `on_poll(run)` is called between polls.
+    """
+    deadline = time.monotonic() + timeout
+    interval = POLL_INITIAL_INTERVAL
+    run = None
+    try:
+        while True:
+            with span('openai.wait_for_run.retrieve'), _assistant_api_errors():
+                run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+            if run.status == 'completed':
+                return run
+            if run.status in RUN_FINISHED_STATUSES or run.status == 'requires_action':
+                raise AssistantRunError(_describe_run_failure(run))
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AssistantRunError(f"Assistant run timed out after {timeout} seconds")
+            if on_poll:
+                on_poll(run)
+            time.sleep(min(remaining, random.uniform(interval / 2, interval)))
+            interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+    finally:
+        if run is None or run.status not in RUN_FINISHED_STATUSES:
+            _cancel_run(client, thread_id, run_id)
+
+
+def _stream_run_text(client, thread_id, assistant_id, timeout=RUN_TIMEOUT):
+    """Start a run with event streaming and yield the assistant's text as it arrives.
+
+    The deadline is checked on every stream event, not only on text, so a run
+    stuck in tool calls or status events is still cancelled after `timeout`
+    seconds. API errors are raised as AssistantRunError once the run is cancelled.
+    """
+    deadline = time.monotonic() + timeout
+    started = time.perf_counter()
+    run = None
+    with _assistant_api_errors(), span('openai.runs.stream') as fields, \
+            client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id) as stream:
+        try:
+            for event in stream:
+                if time.monotonic() > deadline:
+                    raise AssistantRunError(f"Assistant run timed out after {timeout} seconds")
+                if event.event != 'thread.message.delta':
+                    continue
+                for content in event.data.delta.content or []:
+                    if content.type == 'text' and content.text and content.text.value:
+                        if 'first_token_ms' not in fields:
+                            fields['first_token_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                        yield content.text.value
+            run = stream.current_run
+        finally:
+            # Also reached when the consumer stops iterating, e.g. on a rerun
+            current = stream.current_run
+            if current is not None and current.status not in RUN_FINISHED_STATUSES:
+                _cancel_run(client, thread_id, current.id)
+    if run is None or run.status != 'completed':
+        raise AssistantRunError(_describe_run_failure(run))
+
+
+def complete_assistant(assistant_id, txt, timeout=RUN_TIMEOUT):
+    """Run an assistant on `txt` without any UI and return its answer.
+
+    Used outside the Streamlit script thread, e.g. by the evaluation worker.
+    """
+    client = get_openai_client()
+    assistant = get_assistant(assistant_id)
+    with _assistant_api_errors():
+        with span('openai.threads.create'):
+            thread = client.beta.threads.create()
+        with span('openai.messages.create'):
+            client.beta.threads.messages.create(thread_id=thread.id, role="user", content=txt)
+    return "".join(_stream_run_text(client, thread.id, assistant.id, timeout=timeout))
+
+
+def run_assistant(assistant_id, txt, return_content=False, display_chat=True, user_name="user", assistant_name="assistant", stream=True, on_text=None, timeout=RUN_TIMEOUT):
+    """Run an assistant on `txt` in a fresh thread.
+
+    With `stream=True` the answer is rendered token by token: into chat
+    messages when `display_chat` is set, otherwise by calling `on_text` with
+    the text received so far. Otherwise the run is polled with backoff. The
+    full answer is returned when `return_content` is set. Raises
+    AssistantRunError when the run fails or exceeds `timeout` seconds.
+    """
+    # Shared client and cached assistant; nothing heavy is kept in the session
+    client = get_openai_client()
+    assistant = get_assistant(assistant_id)
+    with span('openai.threads.create'), _assistant_api_errors():
+        thread = client.beta.threads.create()
     content = ""
 
     if txt:
         # Add a message to the thread from the user
-        message = st.session_state.client.beta.threads.messages.create(
-            thread_id=st.session_state.thread.id,
-            role="user",
-            content=txt
-        )
+        with span('openai.messages.create'), _assistant_api_errors():
+            client.beta.threads.messages.create(
+                thread_id=thread.id,
+                role="user",
+                content=txt
+            )
+
+        if stream:
+            deltas = _stream_run_text(client, thread.id, assistant.id, timeout=timeout)
+            if display_chat:
+                with st.chat_message(name=user_name):  # Custom user name
+                    st.write(txt)
+                with st.chat_message(name=assistant_name):  # Custom assistant name
+                    content = st.write_stream(deltas)
+            else:
+                last_render = 0.0
+                for delta in deltas:
+                    content += delta
+                    if on_text and time.monotonic() - last_render >= STREAM_RENDER_INTERVAL:
+                        on_text(content)
+                        last_render = time.monotonic()
+                if on_text:
+                    on_text(content)
+            return content if return_content else None
 
         # Run the assistant
-        run = st.session_state.client.beta.threads.runs.create(
-            thread_id=st.session_state.thread.id,
-            assistant_id=st.session_state.assistant.id
-        )
+        with span('openai.runs.create'), _assistant_api_errors():
+            run = client.beta.threads.runs.create(
+                thread_id=thread.id,
+                assistant_id=assistant.id
+            )
 
         # Spinner for the ongoing process
         with st.spinner('One moment...'):
-            while True:
-                # Retrieve the run status
-                run_status = st.session_state.client.beta.threads.runs.retrieve(
-                    thread_id=st.session_state.thread.id,
-                    run_id=run.id
+            # Updating the page between polls lets Streamlit interrupt the wait on a rerun
+            elapsed = st.empty()
+            started = time.monotonic()
+            wait_for_run(
+                client, thread.id, run.id, timeout=timeout,
+                on_poll=lambda run: elapsed.caption(f"{int(time.monotonic() - started)}s")
+            )
+            elapsed.empty()
+
+            with span('openai.messages.list'), _assistant_api_errors():
+                messages = client.beta.threads.messages.list(
+                    thread_id=thread.id
                 )
 
-                # If completed, process the messages
-                if run_status.status == 'completed':
-                    messages = st.session_state.client.beta.threads.messages.list(
-                        thread_id=st.session_state.thread.id
-                    )
-
-                    # Loop through messages and display based on the role
-                    for msg in reversed(messages.data):
-                        role = msg.role
-                        content = msg.content[0].text.value
-
-                        # Use st.chat_message to display the message with the correct name
-                        if display_chat:
-                            if role == "user":
-                                with st.chat_message(name=user_name):  # Custom user name
-                                    st.write(content)
-                            else:
-                                with st.chat_message(name=assistant_name):  # Custom assistant name
-                                    st.write(content)
-                    break
-                time.sleep(1)
+            # Loop through messages and display based on the role
+            for msg in reversed(messages.data):
+                role = msg.role
+                content = msg.content[0].text.value
+
+                # Use st.chat_message to display the message with the correct name
+                if display_chat:
+                    if role == "user":
+                        with st.chat_message(name=user_name):  # Custom user name
+                            st.write(content)
+                    else:
+                        with st.chat_message(name=assistant_name):  # Custom assistant name
+                            st.write(content)
 
     # Return content if requested
     if return_content:
@@ -93,18 +337,83 @@ def run_assistant(assistant_id, txt, return_content=False, display_chat=True, us
     
 
 # ------------------ transcribe with GPT 4 vision -------------------------
-def convert_image_to_text(uploaded_file):
+# The vision model scales images to fit 2048x2048 before reading them, so
+# larger uploads only cost bandwidth; grayscale JPEG keeps handwriting legible
+OCR_MAX_SIDE = 2048
+OCR_JPEG_QUALITY = 85
+
+# Transcriptions by SHA-256 of the uploaded bytes, so a re-upload costs no model call
+TRANSCRIPTION_CACHE_TTL = 86400
+_transcription_cache = TTLCache(ttl=TRANSCRIPTION_CACHE_TTL, max_size=256)
+
+# Retried on rate limits and server errors, with exponential backoff
+TRANSCRIPTION_RETRIES = 3
+TRANSCRIPTION_RETRY_BACKOFF = 0.5
+TRANSCRIPTION_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_http_session = None
+_http_session_lock = threading.Lock()
 
-    # Function to encode the image
-    def encode_image(image_file):
-        return base64.b64encode(image_file.read()).decode('utf-8')
 
-    # Encode the uploaded file
-    base64_image = encode_image(uploaded_file)
+def get_http_session():
+    """Return the process-wide requests session for OpenAI REST calls, with pooled connections and retries."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(
+                total=TRANSCRIPTION_RETRIES,
+                backoff_factor=TRANSCRIPTION_RETRY_BACKOFF,
+                status_forcelist=TRANSCRIPTION_RETRY_STATUSES,
+                allowed_methods=frozenset(['POST']),  # Transcribing the same image twice is harmless
+                respect_retry_after_header=True,
+                # After the last retry, return the response so the caller reports OpenAI's error body
+                raise_on_status=False,
+            )
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_maxsize=OPENAI_MAX_KEEPALIVE_CONNECTIONS, max_retries=retry))
+            session.mount('http://', HTTPAdapter(pool_maxsize=OPENAI_MAX_KEEPALIVE_CONNECTIONS, max_retries=retry))
+            _http_session = session
+        return _http_session
+
+
+def prepare_image_for_ocr(data, mime_type=None):
+    """Shrink an uploaded photo for transcription: upright, at most OCR_MAX_SIDE pixels, grayscale JPEG.
+
+    Returns (bytes, MIME type). Data PIL cannot read is returned unchanged
+    with `mime_type`.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG decodes straight at a reduced scale when the photo is much larger
+            image.draft('L', (OCR_MAX_SIDE, OCR_MAX_SIDE))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE))
+            image = image.convert('L')
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=OCR_JPEG_QUALITY, optimize=True)
+        return output.getvalue(), 'image/jpeg'
+    except Exception as e:
+        print(f"Error preprocessing image: {e}")
+        return data, mime_type or 'image/jpeg'
+
+
+def convert_image_to_text(uploaded_file):
+    """Transcribe the handwritten text in an uploaded image, cached by the image's content."""
+    data = uploaded_file.getvalue() if hasattr(uploaded_file, 'getvalue') else uploaded_file.read()
+    cache_key = hashlib.sha256(data).hexdigest()
+    cached = _transcription_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    image_bytes, mime_type = prepare_image_for_ocr(data, getattr(uploaded_file, 'type', None))
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
 
     headers = {
         "Content-Type": "application/json",
-        "Authorization": f"Bearer {api}"
+        "Authorization": f"Bearer {get_secret()['api_key']}"
     }
 
     payload = {
@@ -120,7 +429,7 @@ def convert_image_to_text(uploaded_file):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
+                            "url": f"data:{mime_type};base64,{base64_image}"
                         }
                     }
                 ]
@@ -129,9 +438,15 @@ def convert_image_to_text(uploaded_file):
         "max_tokens": 300
     }
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-    
+    # Same endpoint override as the openai SDK honours
+    base_url = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+    with span('openai.convert_image_to_text.chat_completion', upload_bytes=len(data), image_bytes=len(image_bytes)):
+        response = get_http_session().post(f"{base_url}/chat/completions", headers=headers, json=payload,
+                                           timeout=(OPENAI_CONNECT_TIMEOUT, OPENAI_TIMEOUT))
+
     if response.status_code == 200:
-        return response.json()['choices'][0]['message']['content']
+        text = response.json()['choices'][0]['message']['content']
+        _transcription_cache.set(cache_key, text)
+        return text
     else:
-        raise Exception(f"Error in API call: {response.status_code} - {response.text}")
\ No newline at end of file
+        raise Exception(f"Error in API call: {response.status_code} - {response.text}")
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from datetime import timedelta
+from setup.firebase_setup import db
+from modules.telemetry import span
+from modules.firestore_usage import query_reads
+from modules.cache import TTLCache
+from modules.snapshots import load_snapshot, read_watermark
+
+# Incremental queries re-read this much history before the watermark, so
+# submissions committed slightly out of submit_time order are not missed
+WATERMARK_OVERLAP = timedelta(minutes=2)
+
+# Full rebuild interval, which also drops submissions deleted since the last build
+REBUILD_INTERVAL = 6 * 3600
+
+
+class OrgSubmissionStore:
+    """In-process index of an organization's submissions (user ID and submit time only).
+
+    Built once with a full collection group pass, then kept current with
+    queries for `submit_time >= watermark`, so a refresh costs reads in
+    proportion to new activity instead of total history. When the
+    organization has a Parquet snapshot (jobs.export_snapshots), history is
+    seeded from it and only submissions since the export are queried.
+    """
+
+    def __init__(self, org_code):
+        self.org_code = org_code
+        self._lock = threading.Lock()
+        self._rows = {}  # submission path -> (user_id, submit_time)
+        self.watermark = None
+        self.built_at = None
+        self.last_refresh_reads = 0
+
+    def _query(self):
+        return db.collection_group('submissions').where('org_code', '==', self.org_code).select(['submit_time'])
+
+    def _seed_from_snapshot(self):
+        try:
+            watermark = read_watermark(self.org_code)
+            if watermark is None:
+                return
+            df = load_snapshot(self.org_code, columns=['user_id', 'submit_time'], before=watermark)
+        except Exception as e:
+            print(f"Error reading snapshot of {self.org_code}: {e}")
+            return
+        if df.empty:
+            return
+        submit_times = df['submit_time'].dt.to_pydatetime()
+        self._rows = dict(zip(df['path'], zip(df['user_id'], submit_times)))
+        self.watermark = watermark
+
+    def refresh(self):
+        """Read submissions added since the last refresh (or everything on the first call)."""
+        with self._lock:
+            if self.built_at is None or time.monotonic() - self.built_at > REBUILD_INTERVAL:
+                self._rows = {}
+                self.watermark = None
+                self.built_at = time.monotonic()
+                self._seed_from_snapshot()
+
+            query = self._query()
+            if self.watermark is not None:
+                query = query.where('submit_time', '>=', self.watermark - WATERMARK_OVERLAP)
+
+            reads = 0
+            with span('firestore.org_store.refresh', incremental=self.watermark is not None) as fields:
+                for submission in query.stream():
+                    reads += 1
+                    path = submission.reference.path
+                    if path in self._rows:
+                        continue
+                    submit_time = submission.to_dict().get('submit_time')
+                    self._rows[path] = (submission.reference.parent.parent.id, submit_time)
+                    if submit_time and (self.watermark is None or submit_time > self.watermark):
+                        self.watermark = submit_time
+                fields['reads'] = query_reads(reads)
+            self.last_refresh_reads = reads
+
+    def submissions(self):
+        """(user_id, {'submit_time': ...}) pairs, the shape fetch_org_submissions returns."""
+        with self._lock:
+            return [(user_id, {'submit_time': submit_time}) for user_id, submit_time in self._rows.values()]
+
+
+# Stores kept per process. Each holds a row per submission of its organization,
+# so the least recently used are dropped beyond ORG_STORE_MAX organizations.
+# A store lives no longer than its rebuild interval, after which it would
+# re-read everything anyway.
+ORG_STORE_MAX = int(os.environ.get('ORG_STORE_MAX', 50))
+
+_stores = TTLCache(ttl=REBUILD_INTERVAL, max_size=ORG_STORE_MAX)
+_stores_lock = threading.Lock()
+
+
+def get_org_store(org_code):
+    """Return the process-wide submission store of an organization."""
+    # Under the lock, so concurrent dashboards of one organization share a single build
+    with _stores_lock:
+        return _stores.get_or_load(org_code, lambda: OrgSubmissionStore(org_code))
@@ -0,0 +1,59 @@
+from setup.firebase_setup import db
+from modules.telemetry import span
+from modules.cache import TTLCache
+
+# Organization settings change rarely; re-read them every 5 minutes at most.
+# Unknown codes (e.g. typed during registration) are remembered more briefly.
+# Organization documents are edited in the Firebase console, not by this app,
+# so besides the TTL an entry is only refreshed on this instance when its
+# admin logs in (primed) or out (invalidated).
+ORG_CACHE_TTL = 300
+MISSING_ORG_TTL = 30
+
+# Credentials never enter the cache, which every student session reads;
+# login_organization checks the password against a fresh read
+CREDENTIAL_FIELDS = ('password',)
+
+_org_cache = TTLCache(ttl=ORG_CACHE_TTL, max_size=1000)
+_missing_orgs = TTLCache(ttl=MISSING_ORG_TTL, max_size=1000)
+
+
+def _without_credentials(org_data):
+    return {key: value for key, value in org_data.items() if key not in CREDENTIAL_FIELDS}
+
+
+def get_org_config(org_code):
+    """Return the `organizations/{org_code}` document as a dict, without credentials, or None if it does not exist.
+
+    The dict is shared by every session in the process and must not be modified.
+    """
+    if not org_code:
+        return None
+
+    org_data = _org_cache.get(org_code)
+    if org_data is not None:
+        return org_data
+    if _missing_orgs.get(org_code):
+        return None
+
+    with span('firestore.get_org_config.get_org', reads=1):
+        org_doc = db.collection('organizations').document(org_code).get()
+    if not org_doc.exists:
+        _missing_orgs.set(org_code, True)
+        return None
+
+    org_data = _without_credentials(org_doc.to_dict())
+    _org_cache.set(org_code, org_data)
+    return org_data
+
+
+def prime_org_config(org_code, org_data):
+    """Store a freshly read organization document in the cache."""
+    _missing_orgs.invalidate(org_code)
+    _org_cache.set(org_code, _without_credentials(org_data))
+
+
+def invalidate_org_config(org_code=None):
+    """Forget one organization, or all of them when `org_code` is None."""
+    _org_cache.invalidate(org_code)
+    _missing_orgs.invalidate(org_code)
@@ -0,0 +1,76 @@
+import glob
+import json
+import os
+from datetime import datetime
+import pandas as pd
+
+# Parquet snapshots of organization submissions, written by jobs.export_snapshots:
+#   {SNAPSHOT_ROOT}/{org_code}/month=YYYY-MM/part-*.parquet
+#   {SNAPSHOT_ROOT}/{org_code}/_watermark.json
+#
+# The export job and the app must see the same directory. On Cloud Run, mount
+# one Cloud Storage bucket as a volume (Cloud Storage FUSE) in both the service
+# and the export job and point SNAPSHOT_ROOT at it, e.g.
+#   gcloud run services update SERVICE --add-volume=name=snapshots,type=cloud-storage,bucket=BUCKET \
+#       --add-volume-mount=volume=snapshots,mount-path=/mnt/snapshots --set-env-vars=SNAPSHOT_ROOT=/mnt/snapshots
+# (and the same flags on `gcloud run jobs update`). Without the mount the
+# service reads its own empty disk and falls back to a full Firestore pass.
+SNAPSHOT_ROOT = os.environ.get('SNAPSHOT_ROOT', 'snapshots')
+
+# Columns every snapshot has; `text` and `feedback` are added when bodies are exported
+SNAPSHOT_COLUMNS = [
+    'path', 'user_id', 'org_code', 'submit_time', 'university', 'faculty', 'department',
+    'text_length', 'feedback_length',
+]
+BODY_COLUMNS = ['text', 'feedback']
+
+
+def snapshot_dir(org_code, root=None):
+    return os.path.join(root or SNAPSHOT_ROOT, org_code)
+
+
+def read_watermark(org_code, root=None):
+    """Latest submit_time in the organization's snapshot (UTC), or None if it has none."""
+    path = os.path.join(snapshot_dir(org_code, root), '_watermark.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return datetime.fromisoformat(json.load(f)['watermark'])
+
+
+def write_watermark(org_code, watermark, rows, with_bodies, root=None):
+    path = os.path.join(snapshot_dir(org_code, root), '_watermark.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'watermark': watermark.isoformat(),
+            'exported_at': datetime.now().astimezone().isoformat(),
+            'rows': rows,
+            'with_bodies': with_bodies,
+        }, f)
+    os.replace(tmp_path, path)  # Readers never see a half-written watermark
+
+
+def load_snapshot(org_code, columns=None, since=None, before=None, root=None):
+    """Read an organization's snapshot into a data frame, optionally only `since <= submit_time < before`.
+
+    Rows exported twice (an interrupted export) are dropped by document path.
+    Returns an empty frame when there is no snapshot.
+    """
+    if columns is not None and 'path' not in columns:
+        columns = ['path'] + list(columns)
+
+    files = sorted(glob.glob(os.path.join(snapshot_dir(org_code, root), 'month=*', '*.parquet')))
+    if not files:
+        return pd.DataFrame(columns=columns or SNAPSHOT_COLUMNS)
+
+    frames = [pd.read_parquet(file, columns=columns) for file in files]
+    df = pd.concat(frames, ignore_index=True).drop_duplicates('path', keep='last')
+
+    submit_times = pd.to_datetime(df['submit_time'], utc=True)
+    if since is not None:
+        df = df[submit_times >= pd.Timestamp(since)]
+        submit_times = submit_times[df.index]
+    if before is not None:
+        df = df[submit_times < pd.Timestamp(before)]
+    return df.reset_index(drop=True)
@@ -0,0 +1,161 @@
+from datetime import datetime
+import pytz
+from firebase_admin import firestore
+from setup.firebase_setup import db
+from modules.telemetry import span
+from modules.firestore_usage import count_reads
+from modules.modules import convert_to_timezone
+from modules.org_cache import get_org_config
+from modules.dashboard_cache import invalidate_dashboard
+
+
+def build_evaluation_prompt(uni_name, faculty_name, department_name, txt):
+    """Compose the message the evaluation assistant receives for an essay."""
+    information = f"University: {uni_name}\nFaculty: {faculty_name}\n"
+    if department_name:  # Only include department in information if it exists
+        information += f"Department: {department_name}\n"
+    information += f"\nWriting: {txt}"
+    return information
+
+
+# Length of the text and feedback slices list views read instead of the full bodies
+PREVIEW_LENGTH = 300
+
+
+def submission_previews(txt, feedback):
+    """Preview and length fields stored next to the full text and feedback."""
+    txt = txt or ""
+    feedback = feedback or ""
+    return {
+        'text_preview': txt[:PREVIEW_LENGTH],
+        'feedback_preview': feedback[:PREVIEW_LENGTH],
+        'text_length': len(txt),
+        'feedback_length': len(feedback),
+    }
+
+
+def build_submission(user_data, txt, uni_name, faculty_name, department_name, feedback, submit_time=None):
+    """Return the submission document for a user, with the fields the organization dashboard reads."""
+    # Always save 'submit_time' in UTC
+    submit_time = submit_time or datetime.now(pytz.utc)
+
+    return {
+        'text': txt,
+        'submit_time': submit_time,  # UTC time
+        'university': uni_name,
+        'faculty': faculty_name,
+        'department': department_name if department_name else "",
+        'org_code': user_data.get('org_code', ''),
+        'timezone': user_data.get('timezone', 'UTC'),  # You can still store the user's timezone for reference
+        'feedback': feedback,
+        **submission_previews(txt, feedback)
+    }
+
+
+def counter_timezone(org_code):
+    """Timezone the daily submission counters of an organization's users are kept in.
+
+    The organization dashboard compares `daily_submission_date` with its own
+    today, so the day is the organization's, not the student's.
+    """
+    org_data = get_org_config(org_code) or {}
+    return org_data.get('timezone', 'UTC')
+
+
+def _local_day(submit_time, timezone_str):
+    return convert_to_timezone(submit_time, timezone_str).strftime('%Y-%m-%d')
+
+
+def _count_existing_submissions(user_ref, timezone_str, now):
+    """Counter values for a user written before counters existed, via two aggregation reads."""
+    local_now = convert_to_timezone(now, timezone_str)
+    start_of_day = local_now.replace(hour=0, minute=0, second=0, microsecond=0).astimezone(pytz.utc)
+    submissions_ref = user_ref.collection('submissions')
+    with span('firestore.write_submission.count_existing') as fields:
+        total = submissions_ref.count().get()[0][0].value
+        today = submissions_ref.where('submit_time', '>=', start_of_day).count().get()[0][0].value
+        fields['reads'] = count_reads(total) + count_reads(today)
+    return {
+        'submission_count': total,
+        'daily_submission_date': local_now.strftime('%Y-%m-%d'),
+        'daily_submission_count': today,
+    }
+
+
+def submission_counter_update(user_ref, user_data, submit_time):
+    """Counter fields to merge into the user document for one new submission.
+
+    The user document keeps `submission_count`, `last_submit_time` and the
+    number of submissions on `daily_submission_date` (the organization's
+    local day, see counter_timezone), so dashboards never have to read
+    submissions to count them. `user_data` is updated in place, so several
+    updates for one user can share a batch.
+    """
+    timezone_str = counter_timezone(user_data.get('org_code'))
+    local_day = _local_day(submit_time, timezone_str)
+
+    if 'submission_count' not in user_data:
+        # First submission since counters were introduced: write absolute values
+        user_data.update(_count_existing_submissions(user_ref, timezone_str, submit_time))
+        user_data['submission_count'] += 1
+        if user_data['daily_submission_date'] == local_day:
+            user_data['daily_submission_count'] += 1
+        else:
+            user_data['daily_submission_date'] = local_day
+            user_data['daily_submission_count'] = 1
+        total = user_data['submission_count']
+        daily = user_data['daily_submission_count']
+    else:
+        user_data['submission_count'] += 1
+        total = firestore.Increment(1)
+        if user_data.get('daily_submission_date') == local_day:
+            user_data['daily_submission_count'] = user_data.get('daily_submission_count', 0) + 1
+            daily = firestore.Increment(1)
+        else:
+            user_data['daily_submission_date'] = local_day
+            user_data['daily_submission_count'] = 1
+            daily = 1
+    user_data['last_submit_time'] = submit_time
+
+    return {
+        'submission_count': total,
+        'last_submit_time': submit_time,
+        'daily_submission_date': local_day,
+        'daily_submission_count': daily,
+    }
+
+
+@firestore.transactional
+def _add_submission(transaction, user_ref, submission_ref, txt, uni_name, faculty_name, department_name, feedback, check_existing=False):
+    user_data = user_ref.get(transaction=transaction).to_dict()
+    if check_existing and submission_ref.get(transaction=transaction).exists:
+        # Written by an earlier attempt; counting it again would inflate the counters
+        return user_data.get('org_code', '')
+    submission = build_submission(user_data, txt, uni_name, faculty_name, department_name, feedback)
+    counters = submission_counter_update(user_ref, user_data, submission['submit_time'])
+    transaction.set(submission_ref, submission)
+    transaction.update(user_ref, counters)
+    return submission['org_code']
+
+
+def write_submission(user_id, txt, uni_name, faculty_name, department_name, feedback, submission_id=None):
+    """Save a submission to Firestore with the fields the organization dashboard reads.
+
+    The user's submission counters are updated in the same transaction, and
+    the organization's cached dashboard data is invalidated.
+    Shared by the app and the evaluation worker. Returns the submission ID.
+    With `submission_id` the write is idempotent: if that submission already
+    exists nothing is written, so a retried job cannot save it twice.
+    """
+    user_ref = db.collection('users').document(user_id)
+    submission_ref = user_ref.collection('submissions').document(submission_id)
+    check_existing = submission_id is not None
+    # The user read (and the submission read for a fixed ID), the submission and the
+    # counter update (retried attempts are not counted)
+    with span('firestore.write_submission.transaction', reads=2 if check_existing else 1, writes=2):
+        org_code = _add_submission(db.transaction(), user_ref, submission_ref, txt, uni_name, faculty_name, department_name, feedback,
+                                   check_existing=check_existing)
+
+    # Admins of this organization see the new submission on their next rerun
+    invalidate_dashboard(org_code)
+    return submission_ref.id
@@ -0,0 +1,180 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from modules.firestore_usage import ledger, session_context
+
+# 'spans' logs every external call and a summary per rerun, 'reruns' only the
+# summaries, 'off' nothing (the in-process histogram is always kept)
+TELEMETRY_LOG = os.environ.get('TELEMETRY_LOG', 'reruns')
+
+# Durations kept per (page, call site) for the percentiles; older ones are dropped
+HISTOGRAM_SAMPLES = 1000
+
+# Page reported for calls made outside a tracked rerun (imports, worker threads)
+BACKGROUND_PAGE = 'background'
+
+
+class LatencyHistogram:
+    """Recent call durations per (page, call site), for p50/p95 reporting."""
+
+    def __init__(self, samples=HISTOGRAM_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._durations = defaultdict(lambda: deque(maxlen=self.samples))
+        self._counts = defaultdict(int)
+        self._errors = defaultdict(int)
+
+    def record(self, page, site, duration_ms, error=False):
+        with self._lock:
+            self._durations[(page, site)].append(duration_ms)
+            self._counts[(page, site)] += 1
+            if error:
+                self._errors[(page, site)] += 1
+
+    def summary(self):
+        """One row per (page, call site) with call and error counts and p50/p95/max in ms."""
+        with self._lock:
+            items = [(key, sorted(durations)) for key, durations in self._durations.items()]
+            counts = dict(self._counts)
+            errors = dict(self._errors)
+
+        rows = []
+        for (page, site), durations in sorted(items):
+            rows.append({
+                'page': page,
+                'site': site,
+                'calls': counts[(page, site)],
+                'errors': errors.get((page, site), 0),
+                'p50_ms': round(_percentile(durations, 50), 1),
+                'p95_ms': round(_percentile(durations, 95), 1),
+                'max_ms': round(durations[-1], 1),
+            })
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._errors.clear()
+
+
+def _percentile(sorted_values, percent):
+    # Nearest-rank percentile
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+histogram = LatencyHistogram()
+_local = threading.local()
+
+
+def _log(record):
+    # One JSON object per line; Cloud Run turns these into structured log entries
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+def current_rerun():
+    """The rerun being tracked on this thread, or None."""
+    return getattr(_local, 'rerun', None)
+
+
+def set_rerun_page(page):
+    """Attribute the rest of the current rerun to `page`, e.g. once the view is known."""
+    rerun = current_rerun()
+    if rerun is not None:
+        rerun['page'] = page
+
+
+@contextmanager
+def track_rerun(page):
+    """Group the external calls of one script run; logs a summary by call site at the end.
+
+    Also ends cleanly when the run is stopped by st.rerun() or st.stop().
+    """
+    rerun = {
+        'page': page,
+        'rerun_id': uuid.uuid4().hex[:12],
+        'sites': defaultdict(lambda: {'calls': 0, 'total_ms': 0.0, 'reads': 0, 'writes': 0}),
+        'reads': 0,
+        'writes': 0,
+    }
+    previous = current_rerun()
+    _local.rerun = rerun
+    started = time.perf_counter()
+    try:
+        yield rerun
+    finally:
+        _local.rerun = previous
+        duration_ms = (time.perf_counter() - started) * 1000
+        histogram.record(rerun['page'], 'rerun', duration_ms)
+        # Resolved at the end, so a login during this run is attributed to its org
+        session_id, org_code = session_context()
+        ledger.record_rerun(rerun['page'], rerun['rerun_id'], rerun['reads'], rerun['writes'], session_id, org_code)
+        if TELEMETRY_LOG != 'off':
+            _log({
+                'severity': 'INFO',
+                'message': f"rerun {rerun['page']} {duration_ms:.0f}ms",
+                'event': 'rerun',
+                'page': rerun['page'],
+                'rerun_id': rerun['rerun_id'],
+                'session_id': session_id,
+                'org_code': org_code,
+                'duration_ms': round(duration_ms, 1),
+                'external_ms': round(sum(site['total_ms'] for site in rerun['sites'].values()), 1),
+                'reads': rerun['reads'],
+                'writes': rerun['writes'],
+                'sites': {site: {**stats, 'total_ms': round(stats['total_ms'], 1)}
+                          for site, stats in rerun['sites'].items()},
+            })
+
+
+@contextmanager
+def span(site, **fields):
+    """Time one external call (Firestore, OpenAI, Secret Manager) under a call site name.
+
+    Call sites are named '<service>.<caller>.<operation>'. Yields a dict;
+    entries added to it are included in the span's log record. Firestore
+    calls report the documents they are billed for as `reads` and `writes`,
+    passed up front or set on the dict once known.
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        yield fields
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        rerun = current_rerun()
+        page = rerun['page'] if rerun is not None else BACKGROUND_PAGE
+        histogram.record(page, site, duration_ms, error is not None)
+        reads = fields.get('reads', 0)
+        writes = fields.get('writes', 0)
+        if reads or writes:
+            ledger.record_call(page, site, reads, writes, in_rerun=rerun is not None)
+        if rerun is not None:
+            stats = rerun['sites'][site]
+            stats['calls'] += 1
+            stats['total_ms'] += duration_ms
+            stats['reads'] += reads
+            stats['writes'] += writes
+            rerun['reads'] += reads
+            rerun['writes'] += writes
+        if TELEMETRY_LOG == 'spans':
+            _log({
+                'severity': 'WARNING' if error else 'INFO',
+                'message': f"{site} {duration_ms:.0f}ms",
+                'event': 'span',
+                'page': page,
+                'rerun_id': rerun['rerun_id'] if rerun is not None else None,
+                'site': site,
+                'duration_ms': round(duration_ms, 1),
+                'error': error,
+                **fields,
+            })
@@ -0,0 +1,128 @@
+import importlib
+import json
+import threading
+import time
+
+# Modules the app imports on first use (see app.py); importing them during
+# warm-up spares the first dashboard or submission the wait
+DEFERRED_IMPORTS = (
+    'pandas',
+    'modules.submissions',
+    'extra_pages.org_dashboard',
+    'extra_pages.full_dashboard',
+)
+
+# Document read once to open the Firestore channel; it need not exist
+WARMUP_DOCUMENT = ('organizations', '_warmup')
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_thread = None
+_stages = []  # {'stage', 'duration_ms', 'error'} in the order run
+
+
+def _log(record):
+    # One JSON object per line, like modules.telemetry
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+def _warm_secrets():
+    from modules.modules import get_secret
+    from setup.firebase_setup import get_firebase_creds
+    get_secret()
+    get_firebase_creds()
+
+
+def _warm_firestore():
+    from setup.firebase_setup import get_db
+    from modules.telemetry import span
+    collection, document = WARMUP_DOCUMENT
+    with span('firestore.warmup.get', reads=1):
+        get_db().collection(collection).document(document).get()
+
+
+def _warm_openai():
+    # Retrieving the assistants builds the client and opens pooled TLS connections
+    from modules.modules import preload_assistants
+    preload_assistants()
+
+
+def _warm_password_pool():
+    from auth.password_pool import password_pool
+    password_pool.warm()
+
+
+def _warm_imports():
+    for name in DEFERRED_IMPORTS:
+        importlib.import_module(name)
+
+
+STAGES = (
+    ('secrets', _warm_secrets),
+    ('firestore', _warm_firestore),
+    ('openai', _warm_openai),
+    ('password_pool', _warm_password_pool),
+    ('imports', _warm_imports),
+)
+
+
+def run_warmup():
+    """Run every warm-up stage in order, logging each one's duration.
+
+    A failing stage is logged and skipped; what it would have primed is then
+    initialized on first use as usual. Sets the readiness flag at the end.
+    """
+    started = time.perf_counter()
+    for stage, warm in STAGES:
+        stage_started = time.perf_counter()
+        error = None
+        try:
+            warm()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        duration_ms = round((time.perf_counter() - stage_started) * 1000, 1)
+        with _lock:
+            _stages.append({'stage': stage, 'duration_ms': duration_ms, 'error': error})
+        _log({
+            'severity': 'WARNING' if error else 'INFO',
+            'message': f"warm-up {stage} {duration_ms:.0f}ms" + (f" failed: {error}" if error else ""),
+            'event': 'warmup',
+            'stage': stage,
+            'duration_ms': duration_ms,
+            'error': error,
+        })
+
+    _ready.set()
+    _log({
+        'severity': 'INFO',
+        'message': f"warm-up done in {(time.perf_counter() - started) * 1000:.0f}ms",
+        'event': 'warmup',
+        'stage': 'total',
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+def start_warmup():
+    """Run the warm-up on a background thread, once per process. Returns the thread."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_warmup, name='warmup', daemon=True)
+            _thread.start()
+        return _thread
+
+
+def is_ready():
+    """True once every warm-up stage has run (successfully or not)."""
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout=None):
+    """Block until the warm-up is done or `timeout` seconds pass. Returns is_ready()."""
+    return _ready.wait(timeout)
+
+
+def warmup_report():
+    """The stages run so far with their durations in ms and errors, in order."""
+    with _lock:
+        return [dict(stage) for stage in _stages]
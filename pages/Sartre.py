@@ -1,6 +1,7 @@
 import streamlit as st
-from modules.modules import run_assistant, get_secret
+from modules.modules import run_assistant, get_secret, AssistantRunError
 from modules.menu import menu
+from modules.telemetry import track_rerun
 
 if 'user' not in st.session_state:
     st.session_state.user = None
@@ -43,7 +44,11 @@ def chat_with_sartre():
     if user_input:
         temporary.empty()
         # Pass custom names for user and assistant
-        run_assistant(assistant_id=assistant, txt=user_input, assistant_name="ai")
+        try:
+            run_assistant(assistant_id=assistant, txt=user_input, assistant_name="ai")
+        except AssistantRunError as e:
+            print(f"Error running assistant: {e}")
+            st.error("回答の生成中にエラーが発生しました。もう一度お試しください。")
 
     return user_input
 
@@ -68,4 +73,5 @@ if __name__ == "__main__":
     </style>
     """, unsafe_allow_html=True)
 
-    chat_with_sartre()
+    with track_rerun('sartre'):
+        chat_with_sartre()
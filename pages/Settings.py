@@ -2,16 +2,21 @@ import streamlit as st
 import pytz
 from setup.firebase_setup import db
 from modules.menu import menu
+from auth.login_manager import save_user_session
+from modules.telemetry import span, track_rerun
 
 if 'user' not in st.session_state:
     st.session_state.user = None
 
 def update_user_settings(user_id, timezone):
     user_ref = db.collection('users').document(user_id)
-    user_ref.update({
-        'timezone': timezone
-    })
+    with span('firestore.update_user_settings.update', writes=1):
+        user_ref.update({
+            'timezone': timezone
+        })
     st.session_state.user['timezone'] = timezone
+    # Keep the login session in step so a reload shows the new timezone
+    save_user_session()
     st.success("設定が正常に更新されました！")
 
 def settings_page():
@@ -24,7 +29,8 @@ def settings_page():
         return
 
     user_id = st.session_state.user['id']
-    user_data = db.collection('users').document(user_id).get().to_dict()
+    with span('firestore.settings_page.get_user', reads=1):
+        user_data = db.collection('users').document(user_id).get().to_dict()
 
     with st.form("settings_form"):
         st.subheader("タイムゾーン")
@@ -68,4 +74,5 @@ if __name__ == "__main__":
     </style>
     """, unsafe_allow_html=True)
 
-    settings_page()
+    with track_rerun('settings'):
+        settings_page()
@@ -0,0 +1,29 @@
+"""Start the app with warmed-up clients.
+
+Usage:
+    python serve.py [streamlit options, e.g. --server.port=8080]
+
+Runs the warm-up (modules/warmup.py), then starts Streamlit on app.py in
+this same process, so the primed secret cache, Firestore and OpenAI clients,
+assistant cache and password workers serve the first requests. The port
+only opens once the warm-up is done or WARMUP_TIMEOUT seconds have passed,
+so a platform routing traffic on an open port (Cloud Run's default startup
+probe) sends none to a cold instance. The warm-up keeps running in the
+background if it overruns.
+"""
+import os
+import sys
+from modules.warmup import start_warmup, wait_until_ready
+
+# Seconds to hold the server back for the warm-up; 0 starts serving at once
+WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT', 30))
+
+
+if __name__ == "__main__":
+    start_warmup()
+    if WARMUP_TIMEOUT > 0 and not wait_until_ready(WARMUP_TIMEOUT):
+        print(f"Warm-up still running after {WARMUP_TIMEOUT:.0f}s; starting the server anyway", flush=True)
+
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', 'app.py', *sys.argv[1:]]
+    sys.exit(cli.main())
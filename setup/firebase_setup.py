@@ -1,20 +1,38 @@
-import json
-from google.cloud import firestore, secretmanager
-import firebase_admin
-from firebase_admin import credentials, firestore
+import threading
+from setup.secret_cache import get_cached_secret
+
+FIREBASE_SECRET_NAME = "projects/581656499945/secrets/firebase-service-account-key/versions/latest"
+
+_client = None
+_client_lock = threading.Lock()
 
 def get_firebase_creds():
-    client = secretmanager.SecretManagerServiceClient()
-    secret_name = "projects/581656499945/secrets/firebase-service-account-key/versions/latest"
-    response = client.access_secret_version(request={"name": secret_name})
-    secret_string = response.payload.data.decode("UTF-8")
-    return json.loads(secret_string)
+    return get_cached_secret(FIREBASE_SECRET_NAME)
+
+def get_db():
+    """Return the Firestore client, initializing the Firebase Admin SDK on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Imported here: the SDK and its gRPC stack are slow to import
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+                # Initialize Firebase Admin SDK with the credentials
+                cred = credentials.Certificate(get_firebase_creds())
+                firebase_admin.initialize_app(cred)
+                _client = firestore.client()
+    return _client
+
+
+class _LazyClient:
+    """Stands in for the Firestore client and creates it on first attribute access,
+    so importing a module that uses `db` costs no secret fetch or SDK start-up."""
 
-firebase_creds = get_firebase_creds()
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
 
-# Initialize Firebase Admin SDK with the credentials
-cred = credentials.Certificate(firebase_creds)
-firebase_admin.initialize_app(cred)
 
-# Initialize Firestore DB
-db = firestore.client()
+# Initialize Firestore DB (deferred until first use)
+db = _LazyClient()
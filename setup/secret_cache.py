@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from modules.telemetry import span
+
+# Secrets rarely change, so a fetched value is served for DEFAULT_TTL seconds.
+# Once an entry is older than REFRESH_AFTER it is refreshed in the background
+# while callers keep getting the cached value.
+DEFAULT_TTL = 600
+REFRESH_AFTER = 480
+
+
+class SecretCache:
+    """Thread-safe, process-wide cache of JSON secrets from Secret Manager.
+
+    Only one fetch per secret is in flight at a time: concurrent callers that
+    find an expired entry wait for the leader's fetch instead of issuing their
+    own request.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, refresh_after=REFRESH_AFTER):
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._client = None
+        self._lock = threading.Lock()
+        self._entries = {}   # name -> (value, fetched_at)
+        self._inflight = {}  # name -> threading.Event
+        self._errors = {}    # name -> exception raised by the last fetch
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                # Imported here so importing the app does not load the gRPC client stack
+                from google.cloud import secretmanager
+                self._client = secretmanager.SecretManagerServiceClient()
+            return self._client
+
+    def _fetch(self, name):
+        with span('secret_manager.access_secret_version'):
+            response = self._get_client().access_secret_version(request={"name": name})
+        secret_string = response.payload.data.decode("UTF-8")
+        return json.loads(secret_string)
+
+    def _refresh(self, name, event):
+        """Fetch a secret and publish the result. Called by the single-flight leader."""
+        try:
+            value = self._fetch(name)
+            with self._lock:
+                self._entries[name] = (value, time.monotonic())
+                self._errors.pop(name, None)
+        except Exception as e:
+            print(f"Error fetching secret {name}: {e}")
+            with self._lock:
+                self._errors[name] = e
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+            event.set()
+
+    def _start_flight(self, name):
+        """Register a fetch for `name`. Returns (event, is_leader). Caller must hold the lock."""
+        event = self._inflight.get(name)
+        if event is not None:
+            return event, False
+        event = threading.Event()
+        self._inflight[name] = event
+        return event, True
+
+    def get(self, name):
+        """Return the secret `name`, fetching it at most once across concurrent callers."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                value, fetched_at = entry
+                age = now - fetched_at
+                if age < self.ttl:
+                    if age >= self.refresh_after:
+                        event, is_leader = self._start_flight(name)
+                        if is_leader:
+                            threading.Thread(
+                                target=self._refresh, args=(name, event), daemon=True
+                            ).start()
+                    return value
+            event, is_leader = self._start_flight(name)
+
+        if is_leader:
+            self._refresh(name, event)
+        else:
+            event.wait()
+
+        with self._lock:
+            entry = self._entries.get(name)
+            error = self._errors.get(name)
+        if entry is not None:
+            if error is not None:
+                # Secret Manager is unavailable; keep serving the last known value
+                print(f"Serving stale secret {name} after fetch error")
+            return entry[0]
+        raise error if error is not None else RuntimeError(f"Secret {name} could not be loaded")
+
+    def prime(self, name, value):
+        """Store a value for `name` without calling Secret Manager."""
+        with self._lock:
+            self._entries[name] = (value, time.monotonic())
+
+    def invalidate(self, name=None):
+        """Drop one cached secret, or all of them when `name` is None."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+
+# Shared by every session in this process
+secret_cache = SecretCache()
+
+
+def get_cached_secret(name):
+    """Return the JSON secret stored at the Secret Manager resource `name`."""
+    return secret_cache.get(name)
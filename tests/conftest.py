@@ -0,0 +1,10 @@
+import pytest
+from bench.fake_firestore import FakeFirestore
+from setup import firebase_setup
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeFirestore()
+    monkeypatch.setattr(firebase_setup, '_client', fake)
+    return fake
@@ -0,0 +1,29 @@
+import statistics
+import pytest
+from bench.import_budget import probe, DEFAULT_BUDGET_MS
+
+RUNS = 3
+
+
+@pytest.fixture(scope='module')
+def reports():
+    # Each probe imports app.py in a fresh interpreter, like a cold container
+    return [probe() for _ in range(RUNS)]
+
+
+def test_import_stays_within_budget(reports):
+    median_ms = statistics.median(report['import_ms'] for report in reports)
+    assert median_ms <= DEFAULT_BUDGET_MS
+
+
+def test_heavy_sdks_are_deferred(reports):
+    assert reports[-1]['loaded'] == []
+
+
+def test_import_creates_no_clients(reports):
+    assert not reports[-1]['firestore_client']
+    assert not reports[-1]['openai_client']
+
+
+def test_import_fetches_no_secrets(reports):
+    assert reports[-1]['secrets_fetched'] == []
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from auth import session_token
+from test_session_token import make_user
+
+
+def restore_page():
+    import streamlit as st
+    from auth.login_manager import restore_user_session
+    st.session_state.restored = restore_user_session()
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    """Run restore_page as a browser holding `cookies` would."""
+    def run(cookies):
+        monkeypatch.setattr(st, 'context', SimpleNamespace(cookies=cookies))
+        return AppTest.from_function(restore_page).run()
+    return run
+
+
+def test_valid_cookie_restores_the_user(db, browser):
+    session_id = session_token.create_session(make_user())
+    at = browser({session_token.SESSION_COOKIE: session_id})
+    assert at.session_state.restored['id'] == 'student1'
+    assert at.session_state.session_id == session_id
+
+
+def test_cookie_of_a_user_whose_sessions_were_revoked_is_rejected(db, browser):
+    session_id = session_token.create_session(make_user())
+    session_token.revoke_user_sessions('student1')
+    at = browser({session_token.SESSION_COOKIE: session_id})
+    assert at.session_state.restored is None
+    assert 'user' not in at.session_state
+    assert 'session_id' not in at.session_state
+
+
+def test_tampered_cookie_is_rejected(db, browser):
+    session_id = session_token.create_session(make_user())
+    at = browser({session_token.SESSION_COOKIE: session_id[::-1]})
+    assert at.session_state.restored is None
+    assert 'user' not in at.session_state
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import pytest
+import pytz
+from auth import session_token
+
+
+def make_user(user_id='student1'):
+    return {
+        'id': user_id, 'email': f"{user_id}@example.com", 'university': '東京大学', 'faculty': '法学部',
+        'department': '', 'org_code': 'org1', 'timezone': 'Asia/Tokyo', 'status': 'Active', 'days_left': 30,
+        'register_at': datetime.now(pytz.utc) - timedelta(days=1), 'active_days': 30,
+    }
+
+
+def test_valid_session_returns_user(db):
+    user = make_user()
+    session_id = session_token.create_session(user)
+    assert session_token.read_session(session_id) == user
+
+
+def test_session_id_is_not_stored(db):
+    session_id = session_token.create_session(make_user())
+    stored = [doc_id for _, doc_id, _ in db._scan(session_token.SESSIONS_COLLECTION)]
+    assert stored and session_id not in stored
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda session_id: session_id[:-1] + ('A' if session_id[-1] != 'A' else 'B'),
+    lambda session_id: session_id + 'x',
+    lambda session_id: '',
+    lambda session_id: None,
+])
+def test_tampered_session_id_is_rejected(db, tamper):
+    session_id = session_token.create_session(make_user())
+    assert session_token.read_session(tamper(session_id)) is None
+
+
+def test_expired_session_is_rejected_and_deleted(db):
+    session_id = session_token.create_session(make_user(), ttl=-1)
+    assert session_token.read_session(session_id) is None
+    assert list(db._scan(session_token.SESSIONS_COLLECTION)) == []
+
+
+def test_revoked_session_is_rejected(db):
+    session_id = session_token.create_session(make_user())
+    other_session_id = session_token.create_session(make_user())
+    session_token.revoke_session(session_id)
+    assert session_token.read_session(session_id) is None
+    assert session_token.read_session(other_session_id) is not None
+
+
+def test_password_reset_revokes_every_session_of_the_user(db):
+    sessions = [session_token.create_session(make_user()) for _ in range(3)]
+    other_user_session = session_token.create_session(make_user('student2'))
+    assert session_token.revoke_user_sessions('student1') == 3
+    assert all(session_token.read_session(session_id) is None for session_id in sessions)
+    assert session_token.read_session(other_user_session) is not None
+
+
+def test_updated_session_user_is_returned(db):
+    user = make_user()
+    session_id = session_token.create_session(user)
+    session_token.update_session(session_id, {**user, 'timezone': 'UTC'})
+    assert session_token.read_session(session_id)['timezone'] == 'UTC'
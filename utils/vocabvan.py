@@ -1,5 +1,5 @@
 import streamlit as st
-from modules.modules import run_assistant, get_secret
+from modules.modules import run_assistant, get_secret, AssistantRunError
 
 def vocabvan_interface():
     secrets = get_secret()
@@ -37,6 +37,10 @@ def vocabvan_interface():
     
     if user_input:
         temporary.empty()
-        run_assistant(assistant_id=assistant, txt=user_input)
+        try:
+            run_assistant(assistant_id=assistant, txt=user_input)
+        except AssistantRunError as e:
+            print(f"Error running assistant: {e}")
+            st.error("回答の生成中にエラーが発生しました。もう一度お試しください。")
 
     return user_input
\ No newline at end of file